@@ -0,0 +1,84 @@
+import asyncio
+import itertools
+
+_ids = itertools.count(1)
+
+class FakeMessage:
+    """
+    Message returned by the fake channel. Edits and reactions only take the simulated latency.
+    """
+    def __init__(self, channel, embeds, view):
+        self.id = next(_ids)
+        self.channel = channel
+        self.embeds = embeds
+        self.view = view
+
+    async def edit(self, embed=None, view=None):
+        await self.channel.call("edit")
+        if embed is not None:
+            self.embeds = [embed]
+        self.view = view
+        return self
+
+    async def add_reaction(self, emoji):
+        await self.channel.call("reaction")
+
+class FakeChannel:
+    """
+    Text channel (or DM) that records what the bot sends to it.
+    """
+    def __init__(self, channel_id, latency=0.05):
+        """
+        :params channel_id: ID of the channel
+        :params latency: Seconds every Discord call takes
+        """
+        self.id = channel_id
+        self.latency = latency
+        self.calls = 0
+        self.messages = {}
+        self.titles = []
+
+    async def call(self, kind):
+        self.calls += 1
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+
+    async def send(self, embed=None, embeds=None, view=None):
+        await self.call("send")
+        embeds = embeds if embeds is not None else [embed]
+        message = FakeMessage(self, embeds, view)
+        self.messages[message.id] = message
+        self.titles.extend(getattr(item, "title", "") for item in embeds)
+        return message
+
+class FakeUser:
+    """
+    Discord user with a DM channel.
+    """
+    def __init__(self, user_id, name, latency=0.05):
+        self.id = user_id
+        self.name = name
+        self.dm_channel = FakeChannel(user_id, latency)
+
+    async def send(self, embed=None, embeds=None, view=None):
+        return await self.dm_channel.send(embed=embed, embeds=embeds, view=view)
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+
+class FakeContext:
+    """
+    Command context of one message, as given by bot.get_context.
+    Remembers the titles of the embeds sent while it handled the command.
+    """
+    def __init__(self, guild, channel, author):
+        self.guild = guild
+        self.channel = channel
+        self.author = author
+        self.titles = []
+
+    async def send(self, embed=None, embeds=None, view=None):
+        message = await self.channel.send(embed=embed, embeds=embeds, view=view)
+        self.titles.extend(getattr(item, "title", "") for item in message.embeds)
+        return message
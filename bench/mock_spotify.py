@@ -0,0 +1,308 @@
+import asyncio
+import hashlib
+import json
+import random
+import time
+from collections import Counter
+from aiohttp import web
+
+class MockSpotify:
+    """
+    Local HTTP server that imitates the parts of the Spotify Web API used by the bot.
+    Objects are generated from their IDs, so every name always maps to the same
+    artist, album, track or playlist. Latency, server errors and 429 responses
+    can be injected to see how the bot behaves when Spotify is slow or throttling.
+    """
+    def __init__(self, latency=0.05, error_rate=0.0, rate_limit=0, retry_after=1, playlist_size=50, seed=1):
+        """
+        :params latency: Average response time, in seconds
+        :params error_rate: Fraction of requests answered with a 500 error
+        :params rate_limit: Requests per second accepted before answering 429 (0 for no limit)
+        :params retry_after: Seconds sent in the Retry-After header of 429 responses
+        :params playlist_size: Number of tracks in every playlist
+        :params seed: Seed of the random generator used for latency and errors
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.playlist_size = playlist_size
+        self.random = random.Random(seed)
+        self.names = {}
+        self.requests = Counter()
+        self._window_start = 0.0
+        self._window_count = 0
+        self._runner = None
+        self.url = None
+
+        self.app = web.Application(middlewares=[self._faults])
+        self.app.add_routes([
+            web.post("/api/token", self.token),
+            web.get("/v1/search", self.search),
+            web.get("/v1/artists", self.several_artists),
+            web.get("/v1/artists/{id}", self.artist),
+            web.get("/v1/artists/{id}/albums", self.artist_albums),
+            web.get("/v1/artists/{id}/top-tracks", self.artist_top_tracks),
+            web.get("/v1/artists/{id}/related-artists", self.related_artists),
+            web.get("/v1/albums/{id}", self.album),
+            web.get("/v1/albums/{id}/tracks", self.album_tracks),
+            web.get("/v1/tracks", self.several_tracks),
+            web.get("/v1/tracks/{id}", self.track),
+            web.get("/v1/audio-features", self.several_audio_features),
+            web.get("/v1/playlists/{id}", self.playlist),
+            web.get("/v1/playlists/{id}/tracks", self.playlist_tracks),
+            web.get("/v1/browse/new-releases", self.new_releases),
+            web.get("/v1/browse/categories", self.categories),
+            web.get("/v1/browse/categories/{id}/playlists", self.category_playlists),
+            web.get("/v1/browse/featured-playlists", self.featured_playlists),
+            web.get("/v1/recommendations/available-genre-seeds", self.genre_seeds),
+            web.get("/v1/recommendations", self.recommendations),
+        ])
+
+    async def start(self, host="127.0.0.1", port=0):
+        """
+        Start the server.
+        :params host: Address to listen on
+        :params port: Port to listen on, 0 for any free port
+        :return: Base url of the server
+        """
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def close(self):
+        """
+        Stop the server.
+        """
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def stats(self):
+        """
+        :return: Dictionary of "endpoint status" to number of requests
+        """
+        return dict(self.requests)
+
+    @web.middleware
+    async def _faults(self, request, handler):
+        endpoint = request.match_info.route.resource.canonical if request.match_info.route.resource else request.path
+        if self.latency > 0:
+            await asyncio.sleep(self.random.uniform(0.5, 1.5) * self.latency)
+
+        if self.rate_limit > 0:
+            now = time.monotonic()
+            if now - self._window_start >= 1:
+                self._window_start = now
+                self._window_count = 0
+            self._window_count += 1
+            if self._window_count > self.rate_limit:
+                self.requests[f"{endpoint} 429"] += 1
+                return web.json_response({"error": {"status": 429, "message": "API rate limit exceeded"}}, status=429, headers={"Retry-After": str(self.retry_after)})
+
+        if self.error_rate > 0 and self.random.random() < self.error_rate:
+            self.requests[f"{endpoint} 500"] += 1
+            return web.json_response({"error": {"status": 500, "message": "Server error"}}, status=500)
+
+        response = await handler(request)
+        self.requests[f"{endpoint} {response.status}"] += 1
+        return response
+
+    def _respond(self, request, data):
+        body = json.dumps(data)
+        etag = '"' + hashlib.md5(body.encode("utf-8")).hexdigest() + '"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.Response(text=body, content_type="application/json", headers={"ETag": etag})
+
+    def _paging(self, request, items, path):
+        limit = int(request.query.get("limit", 20))
+        offset = int(request.query.get("offset", 0))
+        next_url = None
+        if offset + limit < len(items):
+            query = dict(request.query)
+            query.update({"offset": str(offset + limit), "limit": str(limit)})
+            next_url = str(request.url.with_path(path).with_query(query))
+        return {"items": items[offset:offset + limit], "total": len(items), "limit": limit, "offset": offset, "next": next_url}
+
+    #################### OBJECTS ####################
+
+    def _id(self, kind, name):
+        entity_id = kind[:2] + hashlib.md5(f"{kind}:{name}".encode("utf-8")).hexdigest()[:20]
+        self.names[entity_id] = name
+        return entity_id
+
+    def _name(self, entity_id):
+        return self.names.get(entity_id, entity_id)
+
+    def _number(self, entity_id, low, high):
+        return low + int(hashlib.md5(entity_id.encode("utf-8")).hexdigest()[:8], 16) % (high - low + 1)
+
+    def _artist(self, entity_id):
+        return {
+            "id": entity_id,
+            "type": "artist",
+            "name": self._name(entity_id),
+            "genres": ["pop", "rock", "indie"][:self._number(entity_id, 1, 3)],
+            "popularity": self._number(entity_id, 0, 100),
+            "followers": {"total": self._number(entity_id, 100, 10000000)}
+        }
+
+    def _simple_artist(self, name):
+        return {"id": self._id("artist", name), "name": name}
+
+    def _track(self, entity_id):
+        name = self._name(entity_id)
+        return {
+            "id": entity_id,
+            "type": "track",
+            "name": name,
+            "artists": [self._simple_artist(f"Artist {self._number(entity_id, 1, 300)}")],
+            "album": {"id": self._id("album", f"{name} - Single"), "name": f"{name} - Single", "release_date": "2024-01-01"},
+            "popularity": self._number(entity_id, 0, 100),
+            "track_number": self._number(entity_id, 1, 12),
+            "external_urls": {"spotify": f"https://open.spotify.com/track/{entity_id}"}
+        }
+
+    def _album_tracks(self, entity_id):
+        name = self._name(entity_id)
+        return [
+            {"id": self._id("track", f"{name} {number}"), "name": f"{name} {number}", "track_number": number}
+            for number in range(1, self._number(entity_id, 5, 40) + 1)
+        ]
+
+    def _simple_album(self, entity_id):
+        return {
+            "id": entity_id,
+            "type": "album",
+            "name": self._name(entity_id),
+            "album_type": "album" if self._number(entity_id, 0, 2) else "single",
+            "artists": [self._simple_artist(f"Artist {self._number(entity_id, 1, 300)}")],
+            "release_date": "2024-01-01"
+        }
+
+    def _playlist(self, entity_id):
+        name = self._name(entity_id)
+        return {
+            "id": entity_id,
+            "type": "playlist",
+            "name": name,
+            "description": f"Benchmark playlist {name}",
+            "owner": {"display_name": "bench"},
+            "followers": {"total": self._number(entity_id, 0, 100000)},
+            "tracks": {"total": self.playlist_size},
+            "snapshot_id": "snapshot-1",
+            "external_urls": {"spotify": f"https://open.spotify.com/playlist/{entity_id}"}
+        }
+
+    #################### ENDPOINTS ####################
+
+    async def token(self, request):
+        return web.json_response({"access_token": "bench-token", "token_type": "Bearer", "expires_in": 3600})
+
+    async def search(self, request):
+        query = request.query.get("q", "")
+        search_type = request.query.get("type", "track")
+        names = [query.title()] + [f"{query.title()} ({suffix})" for suffix in ["Live", "Remix", "Acoustic", "Demo"]]
+        builders = {"artist": self._artist, "album": self._simple_album, "track": self._track, "playlist": self._playlist}
+        items = [builders[search_type](self._id(search_type, name)) for name in names] if query.strip() else []
+        return web.json_response({f"{search_type}s": {"items": items, "total": len(items), "next": None}})
+
+    async def several_artists(self, request):
+        return web.json_response({"artists": [self._artist(entity_id) for entity_id in request.query["ids"].split(",")]})
+
+    async def artist(self, request):
+        return self._respond(request, self._artist(request.match_info["id"]))
+
+    async def artist_albums(self, request):
+        artist_id = request.match_info["id"]
+        albums = [self._simple_album(self._id("album", f"{self._name(artist_id)} Album {number}")) for number in range(1, self._number(artist_id, 1, 45) + 1)]
+        return web.json_response(self._paging(request, albums, request.path))
+
+    async def artist_top_tracks(self, request):
+        artist_id = request.match_info["id"]
+        return web.json_response({"tracks": [self._track(self._id("track", f"{self._name(artist_id)} Hit {number}")) for number in range(1, 11)]})
+
+    async def related_artists(self, request):
+        artist_id = request.match_info["id"]
+        return web.json_response({"artists": [self._artist(self._id("artist", f"Artist {self._number(artist_id, 1, 300) + number}")) for number in range(1, 21)]})
+
+    async def album(self, request):
+        entity_id = request.match_info["id"]
+        tracks = self._album_tracks(entity_id)
+        album = self._simple_album(entity_id)
+        album.update({
+            "popularity": self._number(entity_id, 0, 100),
+            "label": "Bench Records",
+            "tracks": {"items": tracks[:50], "total": len(tracks), "next": None}
+        })
+        return self._respond(request, album)
+
+    async def album_tracks(self, request):
+        return web.json_response(self._paging(request, self._album_tracks(request.match_info["id"]), request.path))
+
+    async def several_tracks(self, request):
+        return web.json_response({"tracks": [self._track(entity_id) for entity_id in request.query["ids"].split(",")]})
+
+    async def track(self, request):
+        return self._respond(request, self._track(request.match_info["id"]))
+
+    async def several_audio_features(self, request):
+        features = []
+        for entity_id in request.query["ids"].split(","):
+            features.append({
+                "id": entity_id,
+                "key": self._number(entity_id, 0, 11),
+                "mode": self._number(entity_id, 0, 1),
+                "time_signature": 4,
+                "tempo": float(self._number(entity_id, 60, 180)),
+                "danceability": self._number(entity_id, 0, 100) / 100,
+                "instrumentalness": self._number(entity_id + "i", 0, 100) / 100,
+                "acousticness": self._number(entity_id + "a", 0, 100) / 100,
+                "energy": self._number(entity_id + "e", 0, 100) / 100,
+                "loudness": -float(self._number(entity_id, 0, 60)),
+                "speechiness": self._number(entity_id + "s", 0, 100) / 100,
+                "valence": self._number(entity_id + "v", 0, 100) / 100
+            })
+        return web.json_response({"audio_features": features})
+
+    async def playlist(self, request):
+        return self._respond(request, self._playlist(request.match_info["id"]))
+
+    async def playlist_tracks(self, request):
+        playlist_id = request.match_info["id"]
+        name = self._name(playlist_id)
+        items = [{"track": self._track(self._id("track", f"{name} Track {number}"))} for number in range(1, self.playlist_size + 1)]
+        return self._respond(request, self._paging(request, items, request.path))
+
+    async def new_releases(self, request):
+        country = request.query.get("country", "")
+        if country and (len(country) != 2 or not country.isalpha()):
+            return web.json_response({"error": {"status": 400, "message": "Invalid country code"}}, status=400)
+        albums = [self._simple_album(self._id("album", f"New Release {country} {number}")) for number in range(1, 101)]
+        return web.json_response({"albums": self._paging(request, albums, request.path)})
+
+    async def categories(self, request):
+        categories = [{"id": f"category{number}", "name": f"Category {number}"} for number in range(1, 61)]
+        return web.json_response({"categories": self._paging(request, categories, request.path)})
+
+    async def category_playlists(self, request):
+        category_id = request.match_info["id"]
+        playlists = [self._playlist(self._id("playlist", f"{category_id} Mix {number}")) for number in range(1, 21)]
+        return web.json_response({"playlists": self._paging(request, playlists, request.path)})
+
+    async def featured_playlists(self, request):
+        playlists = [self._playlist(self._id("playlist", f"Featured {number}")) for number in range(1, 31)]
+        return web.json_response({"playlists": self._paging(request, playlists, request.path)})
+
+    async def genre_seeds(self, request):
+        return web.json_response({"genres": ["acoustic", "blues", "classical", "dance", "electronic", "hip-hop", "indie", "jazz", "metal", "pop", "rock", "soul"]})
+
+    async def recommendations(self, request):
+        limit = int(request.query.get("limit", 20))
+        seeds = request.query.get("seed_artists", "") + request.query.get("seed_genres", "") + request.query.get("seed_tracks", "")
+        return web.json_response({"tracks": [self._track(self._id("track", f"Recommended {seeds[:8]} {number}")) for number in range(1, limit + 1)]})
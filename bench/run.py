@@ -0,0 +1,310 @@
+"""
+Offline load test of the bot.
+
+Runs handle_responses and the game against a local mock Spotify API and fake
+Discord channels: N guilds send a realistic mix of commands, and the run
+reports throughput, p50/p99 latency and event loop lag for every command.
+
+    python -m bench.run --guilds 20 --duration 30
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+
+import bot
+import games
+import responses
+import spotify
+from bench.fake_discord import FakeChannel, FakeContext, FakeGuild, FakeUser
+from bench.mock_spotify import MockSpotify
+
+COMMAND_MIX = {
+    "#artist": 20,
+    "#track": 15,
+    "#album": 10,
+    "#toptracks": 8,
+    "#albums": 5,
+    "#relatedartists": 5,
+    "#playlist": 5,
+    "#featurestrack": 5,
+    "#recommendations": 5,
+    "#newreleases": 4,
+    "#genres": 3,
+    "#categories": 3,
+    "#featuredplaylists": 3,
+    "#categoryplaylist": 3,
+    "#help": 2,
+    "#game": 1,
+}
+
+ERROR_TITLES = ["Error", "Something went wrong"]
+
+def percentile(values, fraction):
+    """
+    :params values: List of numbers
+    :params fraction: Percentile between 0 and 1
+    :return: Value at the percentile, 0 for an empty list
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def pick_name(rng, prefix, count, typo_rate):
+    """
+    Pick a popular name more often than a rare one (Zipf-like), sometimes misspelled.
+    :params rng: Random generator
+    :params prefix: Prefix of the generated names
+    :params count: Number of different names
+    :params typo_rate: Fraction of names with a letter missing
+    :return: Name
+    """
+    number = min(count, int(rng.paretovariate(1.2)))
+    name = f"{prefix} {number}"
+    if rng.random() < typo_rate:
+        position = rng.randrange(len(prefix))
+        name = name[:position] + name[position + 1:]
+    return name
+
+def make_command(rng, command, typo_rate):
+    """
+    Build the text of a command as a user would type it.
+    :params rng: Random generator
+    :params command: Command token
+    :params typo_rate: Fraction of names with a letter missing
+    :return: Message text
+    """
+    if command in ["#artist", "#toptracks", "#albums", "#relatedartists"]:
+        return f"{command} {pick_name(rng, 'Artist', 300, typo_rate)}"
+    if command in ["#track", "#featurestrack"]:
+        return f"{command} {pick_name(rng, 'Song', 1000, typo_rate)}"
+    if command == "#album":
+        return f"{command} {pick_name(rng, 'Album', 500, typo_rate)}"
+    if command == "#playlist":
+        return f"{command} {pick_name(rng, 'Playlist', 200, typo_rate)}"
+    if command == "#recommendations":
+        artists = ", ".join(pick_name(rng, "Artist", 300, typo_rate) for _ in range(rng.randint(0, 2)))
+        tracks = ", ".join(pick_name(rng, "Song", 1000, typo_rate) for _ in range(rng.randint(1, 2)))
+        return f"{command} {rng.randint(5, 30)} | {artists} | {rng.choice(['pop', 'rock', 'jazz'])} | {tracks}"
+    if command == "#newreleases":
+        return f"{command} {rng.choice(['US', 'US', 'PT', 'GB'])}"
+    if command == "#categoryplaylist":
+        return f"{command} {rng.choice(['', 'category 3', 'category 12'])}"
+    if command == "#game":
+        return f"{command} {pick_name(rng, 'Playlist', 50, 0)} mode={rng.choice(['songs', 'songs', 'artists'])}"
+    return command
+
+class LagMonitor:
+    """
+    Measures event loop lag: how late a short sleep wakes up. Every sample is
+    also counted for the commands running at that moment.
+    """
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.samples = []
+        self.by_command = defaultdict(list)
+        self.running = defaultdict(int)
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._sample())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _sample(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self.samples.append(lag)
+            for command, count in self.running.items():
+                if count:
+                    self.by_command[command].append(lag)
+
+class LoadTest:
+    """
+    Simulated guilds sending commands to the bot for a fixed time.
+    """
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.lag = LagMonitor()
+        self.commands = list(COMMAND_MIX)
+        self.weights = [COMMAND_MIX[command] for command in self.commands]
+
+    async def run_command(self, token, guild, channel, author, text):
+        command = responses.split_command(text)[0]
+        ctx = FakeContext(guild, channel, author)
+        self.lag.running[command] += 1
+        started = time.perf_counter()
+        try:
+            await bot.send_message(ctx, token, text, False)
+            game = responses.game_manager.games.get(channel.id)
+            if command == "#game" and game is not None:
+                players = [FakeUser(author.id * 10 + number, f"player{author.id}_{number}", self.args.discord_latency) for number in range(3)]
+                voter = asyncio.ensure_future(self.vote(channel, game[0], players))
+                try:
+                    await asyncio.shield(game[1])
+                finally:
+                    voter.cancel()
+        finally:
+            self.lag.running[command] -= 1
+        self.latencies[command].append(time.perf_counter() - started)
+        if any(title in ERROR_TITLES for title in ctx.titles):
+            self.errors[command] += 1
+
+    async def vote(self, channel, state, players):
+        """
+        Answer every round of a game like players pressing the buttons (or reactions).
+        """
+        answered = set()
+        while True:
+            await asyncio.sleep(0.02)
+            for message_id, votes in list(responses.reaction_collector.rounds.items()):
+                if message_id not in channel.messages or (message_id, votes.deadline) in answered:
+                    continue
+                answered.add((message_id, votes.deadline))
+                game_round = state.deck.rounds[state.deck.position - 1]
+                for player in players:
+                    correct = self.rng.random() < self.args.correct_rate
+                    answer = next(iter(game_round.answers)) if correct else next(iter({games.HIGHER, games.LOWER} - game_round.answers), games.HIGHER)
+                    if state.display == "buttons":
+                        responses.get_game_view().on_vote(message_id, player.name, answer)
+                    else:
+                        responses.reaction_collector.feed(message_id, player.name, answer)
+
+    async def guild(self, token, guild_number, deadline):
+        guild = FakeGuild(guild_number)
+        channel = FakeChannel(guild_number, self.args.discord_latency)
+        users = [FakeUser(guild_number * 100 + number, f"user{guild_number}_{number}", self.args.discord_latency) for number in range(5)]
+        while True:
+            await asyncio.sleep(self.rng.expovariate(self.args.rate))
+            if time.perf_counter() >= deadline:
+                return
+            command = self.rng.choices(self.commands, self.weights)[0]
+            if command == "#game" and responses.game_manager.is_running(channel.id):
+                continue
+            text = make_command(self.rng, command, self.args.typo_rate)
+            asyncio.ensure_future(self.run_command(token, guild, channel, self.rng.choice(users), text))
+
+    async def run(self):
+        args = self.args
+        server = MockSpotify(args.latency, args.error_rate, args.spotify_server_limit, playlist_size=args.playlist_size, seed=args.seed)
+        url = await server.start()
+        spotify.API_URL = f"{url}/v1"
+        spotify.ACCOUNTS_URL = url
+
+        score_dir = tempfile.mkdtemp(prefix="bench-")
+        responses.disk_cache.configure(path=args.disk_cache)
+        responses.score_store.configure(path=os.path.join(score_dir, "scores.db"), legacy_path="")
+        responses.game_manager.round_delay = args.round_delay
+        responses.ROUND_DURATION = args.round_duration
+        if args.spotify_rate is not None:
+            spotify.client.limiter.configure(rate=args.spotify_rate, burst=args.spotify_burst)
+
+        token = bot.TokenManager("bench", "bench")
+        token.start()
+        responses.browse_data.start(token, ["", "US"])
+
+        self.lag.start()
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*(self.guild(token, number, deadline) for number in range(1, args.guilds + 1)))
+        while any(self.lag.running.values()):
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - started
+        self.lag.stop()
+
+        report = self.report(elapsed, server)
+        await spotify.client.close()
+        await server.close()
+        return report
+
+    def report(self, elapsed, server):
+        commands = {}
+        for command in sorted(self.latencies, key=lambda command: -len(self.latencies[command])):
+            values = self.latencies[command]
+            commands[command] = {
+                "count": len(values),
+                "errors": self.errors[command],
+                "p50_ms": percentile(values, 0.5) * 1000,
+                "p99_ms": percentile(values, 0.99) * 1000,
+                "max_ms": max(values) * 1000,
+                "lag_p99_ms": percentile(self.lag.by_command[command], 0.99) * 1000
+            }
+        total = sum(len(values) for values in self.latencies.values())
+        return {
+            "elapsed_s": elapsed,
+            "commands": total,
+            "throughput_per_s": total / elapsed if elapsed else 0.0,
+            "loop_lag_ms": {
+                "p50": percentile(self.lag.samples, 0.5) * 1000,
+                "p99": percentile(self.lag.samples, 0.99) * 1000,
+                "max": max(self.lag.samples, default=0.0) * 1000
+            },
+            "by_command": commands,
+            "spotify_requests": server.stats(),
+            "spotify_client": {"retries": spotify.client.retries, "throttled": spotify.client.throttled, "coalesced": spotify.client.coalesced},
+            "discord": responses.send_queue.stats(),
+            "caches": {
+                "search": responses.search_cache.stats(),
+                "entities": responses.entity_cache.stats(),
+                "names": responses.names.stats()
+            }
+        }
+
+def print_report(report):
+    print(f"{report['commands']} commands in {report['elapsed_s']:.1f}s: {report['throughput_per_s']:.1f} commands/s")
+    lag = report["loop_lag_ms"]
+    print(f"Event loop lag: p50 {lag['p50']:.1f}ms, p99 {lag['p99']:.1f}ms, max {lag['max']:.1f}ms")
+    print()
+    print(f"{'command':<20}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}{'lag p99':>10}")
+    for command, stats in report["by_command"].items():
+        print(f"{command:<20}{stats['count']:>7}{stats['errors']:>8}{stats['p50_ms']:>10.1f}{stats['p99_ms']:>10.1f}{stats['max_ms']:>10.1f}{stats['lag_p99_ms']:>10.1f}")
+    print()
+    print("#game latency is the length of the whole game.")
+    print(f"Spotify client: {report['spotify_client']}")
+    print(f"Discord: {report['discord']}")
+    print(f"Spotify requests: {sum(report['spotify_requests'].values())} ({', '.join(f'{key}: {value}' for key, value in sorted(report['spotify_requests'].items()))})")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test of the Spotify Discord bot.")
+    parser.add_argument("--guilds", type=int, default=20, help="Number of simulated guilds")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds during which commands are sent")
+    parser.add_argument("--rate", type=float, default=0.5, help="Commands per second sent by each guild")
+    parser.add_argument("--latency", type=float, default=0.05, help="Average latency of the mock Spotify API, in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of Spotify requests answered with 500")
+    parser.add_argument("--spotify-server-limit", type=int, default=0, help="Requests per second the mock API accepts before answering 429 (0 for no limit)")
+    parser.add_argument("--spotify-rate", type=float, default=None, help="Requests per second allowed by the bot's rate limiter")
+    parser.add_argument("--spotify-burst", type=int, default=None, help="Burst allowed by the bot's rate limiter")
+    parser.add_argument("--discord-latency", type=float, default=0.05, help="Seconds every Discord call takes")
+    parser.add_argument("--typo-rate", type=float, default=0.1, help="Fraction of names typed with a letter missing")
+    parser.add_argument("--playlist-size", type=int, default=20, help="Tracks in every playlist")
+    parser.add_argument("--round-duration", type=float, default=0.5, help="Seconds a game round is open")
+    parser.add_argument("--round-delay", type=float, default=0.1, help="Seconds between game rounds")
+    parser.add_argument("--correct-rate", type=float, default=0.85, help="Chance a player answers a round correctly")
+    parser.add_argument("--disk-cache", default="", help="Path of the disk cache (empty to disable it)")
+    parser.add_argument("--seed", type=int, default=1, help="Seed of the random generators")
+    parser.add_argument("--json", default=None, help="Also write the report to this file")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = asyncio.run(LoadTest(args).run())
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -1,36 +1,40 @@
 import os
 import discord
 import responses
+import spotify
+import tracing
 import base64
 import json
-from requests import post
+import time
+import asyncio
 import dotenv
 from discord.ext import commands
 
 
 dotenv.load_dotenv()
 
-def get_token(client_id, client_secret):
+async def get_token(client_id, client_secret):
     """
     Get token from Spotify API
     :params client_id: Spotify client id
     :params client_secret: Spotify client secret
-    :return: Spotify token
+    :return: Spotify token and the number of seconds it is valid for
     """
     auth_string = client_id + ":" + client_secret
     auth_bytes =  auth_string.encode("utf-8")
     auth_base64 = str(base64.b64encode(auth_bytes), "utf-8") 
   
-    url = "https://accounts.spotify.com/api/token"
+    url = f"{spotify.ACCOUNTS_URL}/api/token"
     headers = {
         "Authorization": "Basic " + auth_base64,
         "Content-Type": "application/x-www-form-urlencoded"
     }
     data = {"grant_type": "client_credentials"}
-    result = post(url, headers=headers, data=data)
+    result = await spotify.client.post(url, headers=headers, data=data)
+    result.raise_for_status()
     json_result = json.loads(result.content)
     token = json_result["access_token"]
-    return token
+    return token, json_result.get("expires_in", 3600)
 
 def get_auth_header(token):
     """
@@ -40,11 +44,90 @@ def get_auth_header(token):
     """
     return {"Authorization": "Bearer " + token}
 
+class TokenManager:
+    """
+    Keeps the Spotify client-credentials token fresh.
+    The token is renewed in the background before it expires, and concurrent
+    refresh requests (e.g. several 401s at once) share a single call to Spotify.
+    """
+    def __init__(self, client_id, client_secret, refresh_margin=300, retry_delay=30):
+        """
+        :params client_id: Spotify client id
+        :params client_secret: Spotify client secret
+        :params refresh_margin: Seconds before expiry at which the token is renewed
+        :params retry_delay: Seconds to wait before retrying a failed background refresh
+        """
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.refresh_margin = refresh_margin
+        self.retry_delay = retry_delay
+        self.token = None
+        self.expires_at = 0
+        self._refresh_future = None
+        self._background_task = None
+
+    def start(self):
+        """
+        Start the background refresh task. Safe to call more than once.
+        """
+        if self._background_task is None or self._background_task.done():
+            self._background_task = asyncio.create_task(self._keep_fresh())
+
+    async def get_token(self):
+        """
+        Get a valid token, refreshing it first if it is missing or about to expire.
+        :return: Spotify token
+        """
+        if self.token is None or time.monotonic() >= self.expires_at - self.refresh_margin:
+            await self.refresh()
+        return self.token
+
+    async def get_auth_header(self):
+        """
+        Get authorization header with a fresh token
+        :return: Authorization header
+        """
+        return get_auth_header(await self.get_token())
+
+    async def refresh(self, stale_header=None):
+        """
+        Refresh the token. Callers arriving while a refresh is running wait for it
+        instead of starting a new one.
+        :params stale_header: Header that was rejected. If the token already changed since, no refresh is made
+        :return: Authorization header with the new token
+        """
+        if stale_header is not None and self.token is not None and stale_header != get_auth_header(self.token):
+            return get_auth_header(self.token)
+
+        if self._refresh_future is None:
+            self._refresh_future = asyncio.ensure_future(self._renew())
+        await asyncio.shield(self._refresh_future)
+        return get_auth_header(self.token)
+
+    async def _renew(self):
+        try:
+            token, expires_in = await get_token(self.client_id, self.client_secret)
+            self.token = token
+            self.expires_at = time.monotonic() + expires_in
+        finally:
+            self._refresh_future = None
+
+    async def _keep_fresh(self):
+        while True:
+            delay = self.expires_at - self.refresh_margin - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Error refreshing Spotify token: {e}")
+                await asyncio.sleep(self.retry_delay)
+
 async def send_message(ctx, tokenSpotify, user_message, is_private):
     """
     Send message to discord
     :params ctx: Discord context
-    :params tokenSpotify: Spotify token
+    :params tokenSpotify: Spotify token manager
     :params user_message: Message sent by user
     :params is_private: Boolean to check if message is private
     """
@@ -59,9 +142,49 @@ def run_discord_bot():
     """
     CLIENT_ID = os.getenv('CLIENT_ID')
     CLIENT_SECRET = os.getenv('CLIENT_SECRET')
+
+    responses.search_cache.configure(
+        maxsize=int(os.getenv('SEARCH_CACHE_SIZE', 1024)),
+        ttl=int(os.getenv('SEARCH_CACHE_TTL', 3600)),
+        negative_ttl=int(os.getenv('SEARCH_CACHE_NEGATIVE_TTL', 60))
+    )
+    responses.entity_cache.configure(
+        maxsize=int(os.getenv('ENTITY_CACHE_SIZE', 512)),
+        ttl=int(os.getenv('ENTITY_CACHE_TTL', 300))
+    )
+    responses.names.configure(
+        maxsize=int(os.getenv('NAME_INDEX_SIZE', 5000)),
+        min_score=float(os.getenv('NAME_INDEX_MIN_SCORE', 0.8))
+    )
+    responses.disk_cache.configure(
+        path=os.getenv('DISK_CACHE_PATH', 'spotify_cache.db'),
+        max_bytes=int(os.getenv('DISK_CACHE_MAX_MB', 50)) * 1024 * 1024,
+        ttl=int(os.getenv('DISK_CACHE_TTL', 7 * 24 * 3600))
+    )
+    responses.score_store.configure(path=os.getenv('SCORES_DB', 'scores.db'))
+    responses.send_queue.configure(
+        rate=int(os.getenv('DISCORD_SEND_RATE', 5)),
+        merge_window=float(os.getenv('DISCORD_MERGE_WINDOW', 0.05))
+    )
+    responses.browse_data.configure(refresh_interval=int(os.getenv('BROWSE_REFRESH_INTERVAL', 3600)))
+    spotify.client.limiter.configure(
+        rate=float(os.getenv('SPOTIFY_RATE_LIMIT', 10)),
+        burst=int(os.getenv('SPOTIFY_RATE_BURST', 20))
+    )
+    tracing.tracer.configure(
+        slow_threshold=float(os.getenv('SLOW_COMMAND_MS', 2000)) / 1000,
+        slow_log_path=os.getenv('SLOW_LOG_PATH', 'slow_commands.log')
+    )
+    responses.loop_monitor.configure(
+        threshold=float(os.getenv('LOOP_LAG_THRESHOLD_MS', 250)) / 1000,
+        log_path=os.getenv('LOOP_STALL_LOG_PATH', 'loop_stalls.log')
+    )
+    responses.profiler.configure(directory=os.getenv('PROFILE_DIR', 'profiles'))
+    responses.admin_ids.update(int(user_id) for user_id in os.getenv('ADMIN_IDS', '').split(',') if user_id.strip())
+    metrics_port = os.getenv('METRICS_PORT', '9108')
   
     global tokenSpotify
-    tokenSpotify = get_token(CLIENT_ID, CLIENT_SECRET)
+    tokenSpotify = TokenManager(CLIENT_ID, CLIENT_SECRET)
 
     tokenBot = os.getenv('TOKEN')
     intents = discord.Intents.all()
@@ -70,6 +193,20 @@ def run_discord_bot():
 
     @bot.event
     async def on_ready():
+        tokenSpotify.start()
+        responses.loop_monitor.start()
+        bot.add_view(responses.get_game_view())
+        responses.browse_data.start(tokenSpotify, [""] + os.getenv('BROWSE_COUNTRIES', 'US').upper().split(","))
+        responses.disk_cache.start_compaction(int(os.getenv('DISK_CACHE_COMPACT_INTERVAL', 3600)))
+        try:
+            await responses.leaderboards.ensure_loaded(responses.score_store)
+        except Exception as e:
+            print(f"Error loading leaderboards: {e}")
+        if metrics_port:
+            try:
+                await responses.stats.start_server(os.getenv('METRICS_HOST', '127.0.0.1'), int(metrics_port))
+            except OSError as e:
+                print(f"Error starting metrics server: {e}")
         print(f'{bot.user} is now running!')
 
     @bot.event
@@ -78,13 +215,26 @@ def run_discord_bot():
             return
 
         user_message = str(message.content)
-        ctx = await bot.get_context(message)
+        if not responses.is_command(user_message):
+            return
+
+        guild_id = message.guild.id if message.guild is not None else None
+        with tracing.tracer.trace(message.id, "on_message", guild_id=guild_id, channel_id=message.channel.id, command=responses.split_command(user_message.lstrip('?'))[0]):
+            ctx = await bot.get_context(message)
+
+            if user_message.startswith('?'):
+                user_message = user_message[1:]
+                await send_message(ctx, tokenSpotify, user_message, True)
+            else:
+                await send_message(ctx, tokenSpotify, user_message, False)
+
+    @bot.event
+    async def on_raw_reaction_add(payload):
+        if payload.user_id == bot.user.id:
+            return
 
-        if user_message[0] == '?':
-            user_message = user_message[1:]
-            await send_message(ctx, tokenSpotify, user_message, True)
-        else:
-            await send_message(ctx, tokenSpotify, user_message, False)
+        user_name = payload.member.name if payload.member is not None else str(payload.user_id)
+        responses.reaction_collector.feed(payload.message_id, user_name, str(payload.emoji))
 
     bot.run(tokenBot)
   
\ No newline at end of file
@@ -0,0 +1,383 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+MISSING = object()
+
+class TTLCache:
+    """
+    Bounded in-memory cache with per-entry expiry and LRU eviction.
+    None values are treated as "not found" results and kept for a shorter time.
+    """
+    def __init__(self, maxsize=1024, ttl=3600, negative_ttl=60):
+        """
+        :params maxsize: Maximum number of entries kept
+        :params ttl: Seconds a found result is kept
+        :params negative_ttl: Seconds a "not found" (None) result is kept
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def configure(self, maxsize=None, ttl=None, negative_ttl=None):
+        """
+        Change the cache settings. Entries above the new size are evicted.
+        :params maxsize: Maximum number of entries kept
+        :params ttl: Seconds a found result is kept
+        :params negative_ttl: Seconds a "not found" result is kept
+        """
+        if maxsize is not None:
+            self.maxsize = maxsize
+        if ttl is not None:
+            self.ttl = ttl
+        if negative_ttl is not None:
+            self.negative_ttl = negative_ttl
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def get(self, key):
+        """
+        Get a cached value.
+        :params key: Key of the entry
+        :return: Cached value, or MISSING if there is no fresh entry
+        """
+        entry = self._data.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return MISSING
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value, ttl=None):
+        """
+        Store a value, evicting the least recently used entry if the cache is full.
+        :params key: Key of the entry
+        :params value: Value to store. None is cached as a "not found" result
+        :params ttl: Seconds to keep the value, instead of the cache default
+        """
+        if ttl is None:
+            ttl = self.negative_ttl if value is None else self.ttl
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        """
+        Remove every entry.
+        """
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """
+        Get cache counters.
+        :return: Dictionary with hits, misses, size and hit ratio
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._data),
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
+
+class EntityCache:
+    """
+    Cache of Spotify objects (albums, tracks, playlists...) keyed by object type and ID.
+    Each entry keeps the ETag and snapshot_id it was served with, so a stale
+    entry can be revalidated with a conditional request instead of refetched.
+    """
+    def __init__(self, maxsize=512, ttl=300):
+        """
+        :params maxsize: Maximum number of entries kept
+        :params ttl: Seconds an entry is used without revalidation
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self._data = OrderedDict()
+
+    def configure(self, maxsize=None, ttl=None):
+        """
+        Change the cache settings. Entries above the new size are evicted.
+        :params maxsize: Maximum number of entries kept
+        :params ttl: Seconds an entry is used without revalidation
+        """
+        if maxsize is not None:
+            self.maxsize = maxsize
+        if ttl is not None:
+            self.ttl = ttl
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def get(self, key):
+        """
+        Get an entry, fresh or stale.
+        :params key: Key of the entry
+        :return: Dictionary with data, etag, snapshot_id and fresh_until, or None
+        """
+        entry = self._data.get(key)
+        if entry is not None:
+            self._data.move_to_end(key)
+        return entry
+
+    def is_fresh(self, entry):
+        """
+        Check if an entry can be used without revalidation.
+        :params entry: Entry returned by get
+        :return: True if the entry has not expired yet
+        """
+        return entry is not None and entry["fresh_until"] > time.monotonic()
+
+    def set(self, key, data, etag=None, snapshot_id=None, fresh_for=None):
+        """
+        Store an object.
+        :params key: Key of the entry
+        :params data: JSON object returned by Spotify
+        :params etag: ETag header of the response
+        :params snapshot_id: Playlist snapshot id, if any
+        :params fresh_for: Seconds the entry is fresh, instead of the cache ttl
+        """
+        if self.maxsize <= 0:
+            return
+        self._data[key] = {
+            "data": data,
+            "etag": etag,
+            "snapshot_id": snapshot_id,
+            "fresh_until": time.monotonic() + (self.ttl if fresh_for is None else fresh_for)
+        }
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def touch(self, key):
+        """
+        Mark an entry as fresh again after Spotify confirmed it did not change.
+        :params key: Key of the entry
+        """
+        entry = self._data.get(key)
+        if entry is not None:
+            entry["fresh_until"] = time.monotonic() + self.ttl
+            self.revalidated += 1
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """
+        Get cache counters.
+        :return: Dictionary with hits, misses, revalidations, size and hit ratio
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidated": self.revalidated,
+            "size": len(self._data),
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
+
+class DiskCache:
+    """
+    Persistent cache of Spotify responses in a SQLite file, so a restart starts warm.
+    Entries have their own expiry, the file is kept under a size cap by evicting
+    the least recently used entries, and compact() removes expired entries and
+    gives the space back. Every call runs in a worker thread.
+    """
+    def __init__(self, path="spotify_cache.db", max_bytes=50 * 1024 * 1024, ttl=7 * 24 * 3600):
+        """
+        :params path: Path of the SQLite file, an empty path disables the cache
+        :params max_bytes: Maximum total size of the stored values
+        :params ttl: Default seconds an entry is kept
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._connection = None
+        self._total_bytes = 0
+        self._compaction_task = None
+        self._lock = threading.Lock()
+
+    def configure(self, path=None, max_bytes=None, ttl=None):
+        """
+        Change the cache settings. The path must be set before the first use.
+        :params path: Path of the SQLite file, an empty path disables the cache
+        :params max_bytes: Maximum total size of the stored values
+        :params ttl: Default seconds an entry is kept
+        """
+        if path is not None:
+            self.path = path
+        if max_bytes is not None:
+            self.max_bytes = max_bytes
+        if ttl is not None:
+            self.ttl = ttl
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def _open(self):
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, etag TEXT, snapshot_id TEXT, "
+                "stored_at REAL NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL, size INTEGER NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+            connection.execute("CREATE INDEX IF NOT EXISTS entries_expires ON entries (expires_at)")
+            self._total_bytes = connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            self._connection = connection
+        return self._connection
+
+    def _get(self, key):
+        with self._lock:
+            connection = self._open()
+            row = connection.execute(
+                "SELECT value, etag, snapshot_id, stored_at, expires_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            now = time.time()
+            if row is None or row[4] <= now:
+                self.misses += 1
+                return None
+            connection.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return {"value": json.loads(row[0]), "etag": row[1], "snapshot_id": row[2], "stored_at": row[3], "expires_at": row[4]}
+
+    def _set(self, key, value, ttl, etag, snapshot_id):
+        encoded = json.dumps(value, separators=(",", ":"))
+        size = len(encoded)
+        now = time.time()
+        with self._lock:
+            connection = self._open()
+            old = connection.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            connection.execute(
+                "INSERT OR REPLACE INTO entries (key, value, etag, snapshot_id, stored_at, expires_at, accessed_at, size) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, encoded, etag, snapshot_id, now, now + ttl, now, size)
+            )
+            self._total_bytes += size - (old[0] if old else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict(connection)
+
+    def _evict(self, connection):
+        # Drop expired entries first, then the least recently used ones down to 90% of the cap
+        connection.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),))
+        self._total_bytes = connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        target = self.max_bytes * 0.9
+        while self._total_bytes > target:
+            rows = connection.execute("SELECT key, size FROM entries ORDER BY accessed_at LIMIT 100").fetchall()
+            if not rows:
+                break
+            connection.executemany("DELETE FROM entries WHERE key = ?", [(row[0],) for row in rows])
+            self._total_bytes -= sum(row[1] for row in rows)
+            self.evictions += len(rows)
+
+    def _compact(self):
+        with self._lock:
+            connection = self._open()
+            connection.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),))
+            self._total_bytes = connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            connection.execute("VACUUM")
+
+    async def get(self, key):
+        """
+        Read an entry.
+        :params key: Key of the entry
+        :return: Dictionary with value, etag, snapshot_id, stored_at and expires_at, or None
+        """
+        if not self.enabled:
+            return None
+        try:
+            return await asyncio.to_thread(self._get, key)
+        except sqlite3.Error as e:
+            print(f"Error reading disk cache: {e}")
+            return None
+
+    async def set(self, key, value, ttl=None, etag=None, snapshot_id=None):
+        """
+        Write an entry, evicting old entries if the size cap is passed.
+        :params key: Key of the entry
+        :params value: JSON serializable value
+        :params ttl: Seconds to keep the entry, the cache default if not given
+        :params etag: ETag of the response
+        :params snapshot_id: Playlist snapshot id, if any
+        """
+        if not self.enabled:
+            return
+        try:
+            await asyncio.to_thread(self._set, key, value, self.ttl if ttl is None else ttl, etag, snapshot_id)
+        except sqlite3.Error as e:
+            print(f"Error writing disk cache: {e}")
+
+    def store(self, key, value, ttl=None, etag=None, snapshot_id=None):
+        """
+        Write an entry in the background, without waiting for the disk.
+        :params key: Key of the entry
+        :params value: JSON serializable value
+        :params ttl: Seconds to keep the entry, the cache default if not given
+        :params etag: ETag of the response
+        :params snapshot_id: Playlist snapshot id, if any
+        """
+        if self.enabled:
+            asyncio.ensure_future(self.set(key, value, ttl, etag, snapshot_id))
+
+    async def compact(self):
+        """
+        Remove expired entries and shrink the file.
+        """
+        if not self.enabled:
+            return
+        try:
+            await asyncio.to_thread(self._compact)
+        except sqlite3.Error as e:
+            print(f"Error compacting disk cache: {e}")
+
+    def start_compaction(self, interval):
+        """
+        Start compacting the cache in the background. Safe to call more than once.
+        :params interval: Seconds between compactions
+        """
+        if self.enabled and (self._compaction_task is None or self._compaction_task.done()):
+            self._compaction_task = asyncio.create_task(self._compact_every(interval))
+
+    async def _compact_every(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            await self.compact()
+
+    def stats(self):
+        """
+        Get cache counters.
+        :return: Dictionary with hits, misses, evictions, stored bytes and hit ratio
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "bytes": self._total_bytes,
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
@@ -0,0 +1,240 @@
+import asyncio
+import collections
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+
+def frame_name(frame):
+    """
+    Describe the function of a stack frame.
+    :params frame: Python frame
+    :return: Text like "function (file.py:12)"
+    """
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def running_task_name(loop):
+    """
+    Get the task the loop is running right now. Safe to call from another thread
+    when the loop is given, because it only reads asyncio's table of current tasks.
+    :params loop: Event loop
+    :return: Task and coroutine name, or None if the loop is not running a task
+    """
+    task = asyncio.current_task(loop)
+    if task is None:
+        return None
+    coro = task.get_coro()
+    return f"{task.get_name()} ({getattr(coro, '__qualname__', coro)})"
+
+class LoopMonitor:
+    """
+    Measures event loop lag (how late a heartbeat wakes up) and catches blocking code.
+    A watchdog thread notices when the heartbeat stops for longer than the threshold,
+    and logs the stack of the loop thread and the task that is holding the loop.
+    """
+    def __init__(self, interval=0.1, threshold=0.25, log_path="loop_stalls.log", history=20):
+        """
+        :params interval: Seconds between heartbeats
+        :params threshold: Seconds without a heartbeat after which the loop is considered blocked
+        :params log_path: JSON lines file the stalls are written to, empty to only print them
+        :params history: Number of recent stalls kept in memory
+        """
+        self.interval = interval
+        self.threshold = threshold
+        self.log_path = log_path
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.recent = collections.deque(maxlen=history)
+        self._loop = None
+        self._thread_id = None
+        self._last_beat = None
+        self._task = None
+        self._watchdog = None
+        self._stop = threading.Event()
+
+    def configure(self, threshold=None, log_path=None):
+        """
+        Change the monitor settings.
+        :params threshold: Seconds without a heartbeat after which the loop is considered blocked
+        :params log_path: File the stalls are written to, empty to only print them
+        """
+        if threshold is not None:
+            self.threshold = threshold
+        if log_path is not None:
+            self.log_path = log_path
+
+    def start(self):
+        """
+        Start the heartbeat and the watchdog thread. Must be called from the event loop. Safe to call more than once.
+        """
+        if self._task is not None and not self._task.done():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def stop(self):
+        """
+        Stop the heartbeat and the watchdog thread.
+        """
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.lag = max(0.0, now - expected)
+            self.max_lag = max(self.max_lag, self.lag)
+            self._last_beat = now
+
+    def _watch(self):
+        reported_beat = None
+        while not self._stop.wait(min(self.interval, self.threshold / 2)):
+            last_beat = self._last_beat
+            blocked_for = time.monotonic() - last_beat - self.interval
+            if blocked_for < self.threshold or reported_beat == last_beat:
+                continue
+            reported_beat = last_beat
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            self._report(blocked_for, running_task_name(self._loop), traceback.format_stack(frame))
+
+    def _report(self, blocked_for, task_name, stack):
+        self.stalls += 1
+        stall = {
+            "time": time.time(),
+            "blocked_ms": round(blocked_for * 1000, 1),
+            "task": task_name,
+            "stack": [line.rstrip() for line in stack]
+        }
+        self.recent.append(stall)
+        print(f"Event loop blocked for over {stall['blocked_ms']}ms by {task_name}:\n" + "".join(stack[-8:]))
+        if self.log_path:
+            try:
+                with open(self.log_path, "a") as file:
+                    file.write(json.dumps(stall) + "\n")
+            except OSError as e:
+                print(f"Error writing loop stall log: {e}")
+
+    def stats(self):
+        """
+        Get monitor counters.
+        :return: Dictionary with the last lag, max lag (seconds) and number of stalls
+        """
+        return {"lag": self.lag, "max_lag": self.max_lag, "stalls": self.stalls}
+
+class SamplingProfiler:
+    """
+    On-demand sampling profiler of the event loop thread. A background thread
+    records the loop's stack at a fixed rate, so it can be turned on in production
+    without a restart. Results are written in the folded stacks format used by
+    flame graph tools, with a summary of the hottest functions.
+    """
+    def __init__(self, interval=0.005, directory="profiles", max_duration=300):
+        """
+        :params interval: Seconds between samples
+        :params directory: Folder the profiles are written to
+        :params max_duration: Longest allowed profile, in seconds
+        """
+        self.interval = interval
+        self.directory = directory
+        self.max_duration = max_duration
+        self._thread = None
+        self._stop = threading.Event()
+
+    def configure(self, directory=None):
+        """
+        Change the folder the profiles are written to.
+        :params directory: Folder of the profiles
+        """
+        if directory is not None:
+            self.directory = directory
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, duration):
+        """
+        Profile the event loop thread. Must be called from the event loop.
+        :params duration: Seconds to profile (capped at max_duration)
+        :return: Future resolved with the profile summary when profiling ends
+        """
+        if self.running:
+            raise RuntimeError("A profile is already running")
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(threading.get_ident(), min(duration, self.max_duration), loop, future),
+            name="loop-profiler",
+            daemon=True
+        )
+        self._thread.start()
+        return future
+
+    def stop(self):
+        """
+        End the running profile early. Its results are still written.
+        """
+        self._stop.set()
+
+    def _run(self, thread_id, duration, loop, future):
+        stacks = collections.Counter()
+        leaves = collections.Counter()
+        samples = 0
+        started = time.monotonic()
+        deadline = started + duration
+        while time.monotonic() < deadline and not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                break
+            names = []
+            while frame is not None:
+                names.append(frame_name(frame))
+                frame = frame.f_back
+            names.reverse()
+            stacks[";".join(names)] += 1
+            leaves[names[-1]] += 1
+            samples += 1
+
+        try:
+            summary = self._write(stacks, leaves, samples, time.monotonic() - started)
+        except OSError as e:
+            loop.call_soon_threadsafe(_set_exception, future, e)
+            return
+        loop.call_soon_threadsafe(_set_result, future, summary)
+
+    def _write(self, stacks, leaves, samples, elapsed):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, time.strftime("profile-%Y%m%d-%H%M%S.folded"))
+        with open(path, "w") as file:
+            for stack, count in stacks.most_common():
+                file.write(f"{stack} {count}\n")
+        return {
+            "path": path,
+            "samples": samples,
+            "seconds": elapsed,
+            "top": [(name, count / samples if samples else 0.0) for name, count in leaves.most_common(10)]
+        }
+
+def _set_result(future, result):
+    if not future.done():
+        future.set_result(result)
+
+def _set_exception(future, exception):
+    if not future.done():
+        future.set_exception(exception)
@@ -0,0 +1,246 @@
+import asyncio
+import random
+import time
+
+HIGHER = '⬆️'
+LOWER = '⬇️'
+DISPLAYS = ["buttons", "reactions"]
+
+class GameState:
+    """
+    State of one higher or lower game.
+    """
+    def __init__(self, channel_id, playlist_name, mode, display="buttons"):
+        """
+        :params channel_id: ID of the Discord channel the game runs in
+        :params playlist_name: Playlist name or url given by the user
+        :params mode: Mode of the game. Can be "songs" or "artists"
+        :params display: How rounds are shown. Can be "buttons" (one message edited every round) or "reactions" (one message per round)
+        """
+        self.channel_id = channel_id
+        self.playlist_name = playlist_name
+        self.mode = mode
+        self.display = display
+        self.deck = None
+        self.participants = []
+        self.players_scores = {}
+        self.round = 0
+        self.started_at = time.monotonic()
+
+    @property
+    def first_round(self):
+        return self.round == 0
+
+class GameRound:
+    """
+    One precomputed round of the game.
+    """
+    def __init__(self, current_item, next_item):
+        """
+        :params current_item: Item the question is about, with name and popularity
+        :params next_item: Item it is compared against
+        """
+        self.current_item = current_item
+        self.next_item = next_item
+        self.prompt = f"Is the popularity of '{current_item['name']}' higher or lower than '{next_item['name']}'?"
+        if current_item['popularity'] > next_item['popularity']:
+            self.answers = {HIGHER}
+        elif current_item['popularity'] < next_item['popularity']:
+            self.answers = {LOWER}
+        else:
+            self.answers = {HIGHER, LOWER}
+
+    def is_correct(self, emoji):
+        """
+        Check an answer. On a tie both answers are correct.
+        :params emoji: Emoji chosen by the player
+        :return: True if the answer is correct
+        """
+        return emoji in self.answers
+
+class GameDeck:
+    """
+    Items of a game shuffled once, with every round built up front so
+    each round costs O(1). Works for both the songs and artists modes.
+    """
+    def __init__(self, items, rng=random):
+        """
+        :params items: List of dictionaries with name and popularity
+        :params rng: Random generator used for the shuffle
+        """
+        order = list(items)
+        rng.shuffle(order)
+        self.rounds = [GameRound(current_item, next_item) for current_item, next_item in zip(order, order[1:])]
+        self.position = 0
+
+    def __len__(self):
+        return len(self.rounds)
+
+    def remaining(self):
+        """
+        :return: Number of rounds not played yet
+        """
+        return len(self.rounds) - self.position
+
+    def next_round(self):
+        """
+        Get the next round.
+        :return: GameRound, or None when the deck is finished
+        """
+        if self.position >= len(self.rounds):
+            return None
+        game_round = self.rounds[self.position]
+        self.position += 1
+        return game_round
+
+class GameManager:
+    """
+    Runs every game as its own task, with at most one active game per channel.
+    """
+    def __init__(self, round_delay=1):
+        """
+        :params round_delay: Seconds to wait between rounds
+        """
+        self.round_delay = round_delay
+        self.games = {}
+
+    def is_running(self, channel_id):
+        """
+        Check if a channel already has an active game.
+        :params channel_id: ID of the Discord channel
+        :return: True if a game is running in the channel
+        """
+        return channel_id in self.games
+
+    def active_count(self):
+        """
+        :return: Number of games running
+        """
+        return len(self.games)
+
+    def start(self, state, coro):
+        """
+        Start a game task. The channel is released when the task ends.
+        :params state: GameState of the new game
+        :params coro: Coroutine that plays the game
+        :return: Task of the game
+        """
+        if self.is_running(state.channel_id):
+            coro.close()
+            raise RuntimeError(f"A game is already running in channel {state.channel_id}")
+
+        task = asyncio.ensure_future(coro)
+        self.games[state.channel_id] = (state, task)
+        task.add_done_callback(lambda finished: self._finish(state, finished))
+        return task
+
+    def stop(self, channel_id):
+        """
+        Cancel the game of a channel, if there is one.
+        :params channel_id: ID of the Discord channel
+        """
+        game = self.games.get(channel_id)
+        if game is not None:
+            game[1].cancel()
+
+    async def wait_round(self):
+        """
+        Pause between rounds without blocking the event loop.
+        """
+        await asyncio.sleep(self.round_delay)
+
+    def _finish(self, state, task):
+        if self.games.get(state.channel_id, (None, None))[1] is task:
+            del self.games[state.channel_id]
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Error in game: {task.exception()}")
+
+class RoundVotes:
+    """
+    Votes of one game round, open until a fixed deadline.
+    """
+    def __init__(self, message_id, choices, deadline):
+        """
+        :params message_id: ID of the round message
+        :params choices: Emojis accepted as answers
+        :params deadline: Loop time at which the round closes
+        """
+        self.message_id = message_id
+        self.choices = choices
+        self.deadline = deadline
+        self.votes = {}
+
+    def add(self, user_name, emoji):
+        """
+        Register a vote. Only the first valid answer of each user counts.
+        :params user_name: Name of the user
+        :params emoji: Emoji of the reaction
+        :return: True if the vote was counted
+        """
+        if emoji not in self.choices or user_name in self.votes:
+            return False
+        self.votes[user_name] = emoji
+        return True
+
+    async def wait(self):
+        """
+        Wait until the round deadline.
+        """
+        delay = self.deadline - asyncio.get_running_loop().time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+class ReactionCollector:
+    """
+    Routes raw reaction events to the open round of their message.
+    Rounds are found by message ID, so votes on other messages are ignored and
+    the Discord message cache is not needed.
+    """
+    def __init__(self):
+        self.rounds = {}
+
+    def open_round(self, message_id, choices, duration):
+        """
+        Start accepting votes for a message.
+        :params message_id: ID of the round message
+        :params choices: Emojis accepted as answers
+        :params duration: Seconds until the round closes
+        :return: RoundVotes of the round
+        """
+        deadline = asyncio.get_running_loop().time() + duration
+        votes = RoundVotes(message_id, choices, deadline)
+        self.rounds[message_id] = votes
+        return votes
+
+    def close_round(self, message_id):
+        """
+        Stop accepting votes for a message.
+        :params message_id: ID of the round message
+        :return: RoundVotes of the round, or None
+        """
+        return self.rounds.pop(message_id, None)
+
+    async def collect(self, votes):
+        """
+        Wait for the round deadline and close the round.
+        :params votes: RoundVotes returned by open_round
+        :return: Dictionary of user name to emoji
+        """
+        try:
+            await votes.wait()
+        finally:
+            self.close_round(votes.message_id)
+        return votes.votes
+
+    def feed(self, message_id, user_name, emoji):
+        """
+        Handle a reaction event.
+        :params message_id: ID of the message that got the reaction
+        :params user_name: Name of the user who reacted
+        :params emoji: Emoji of the reaction
+        :return: True if the reaction was counted as a vote
+        """
+        votes = self.rounds.get(message_id)
+        if votes is None:
+            return False
+        return votes.add(user_name, emoji)
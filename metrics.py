@@ -0,0 +1,182 @@
+import bisect
+from aiohttp import web
+
+class Histogram:
+    """
+    Latency histogram with fixed buckets, as used by Prometheus.
+    Recording a value is a binary search and two additions.
+    """
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self, buckets=BUCKETS):
+        """
+        :params buckets: Upper bounds of the buckets, in seconds
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """
+        Record a value.
+        :params value: Value in seconds
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, fraction):
+        """
+        Estimate a quantile from the buckets.
+        :params fraction: Quantile between 0 and 1
+        :return: Upper bound of the bucket holding the quantile, in seconds (inf past the last bucket)
+        """
+        if self.count == 0:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+class Metrics:
+    """
+    Metrics of the bot. Command latencies are recorded as they happen; everything
+    else (Spotify calls, Discord sends, games, caches) is read from the counters
+    the components already keep, only when the metrics are asked for.
+    """
+    def __init__(self, prefix="spotify_bot"):
+        """
+        :params prefix: Prefix of every Prometheus metric name
+        """
+        self.prefix = prefix
+        self.commands = {}
+        self.command_errors = {}
+        self._collectors = []
+        self._runner = None
+
+    def observe_command(self, command, seconds, error=False):
+        """
+        Record the run of a command.
+        :params command: Command token (e.g. #artist)
+        :params seconds: Time the command took
+        :params error: Boolean to check if the command raised an error
+        """
+        histogram = self.commands.get(command)
+        if histogram is None:
+            histogram = self.commands[command] = Histogram()
+        histogram.observe(seconds)
+        if error:
+            self.command_errors[command] = self.command_errors.get(command, 0) + 1
+
+    def add_counter(self, name, help, collect, labels=()):
+        """
+        Register a counter read from a component.
+        :params name: Metric name, without prefix
+        :params help: Description of the metric
+        :params collect: Function returning a number, or a dictionary of label values (tuple) to number
+        :params labels: Names of the labels, if collect returns a dictionary
+        """
+        self._collectors.append((name, "counter", help, collect, labels))
+
+    def add_gauge(self, name, help, collect, labels=()):
+        """
+        Register a gauge read from a component.
+        :params name: Metric name, without prefix
+        :params help: Description of the metric
+        :params collect: Function returning a number, or a dictionary of label values (tuple) to number
+        :params labels: Names of the labels, if collect returns a dictionary
+        """
+        self._collectors.append((name, "gauge", help, collect, labels))
+
+    def collect(self):
+        """
+        Read every registered counter and gauge.
+        :return: Dictionary of metric name to number, or to a dictionary of label values to number
+        """
+        values = {}
+        for name, _, _, collect, _ in self._collectors:
+            try:
+                values[name] = collect()
+            except Exception as e:
+                print(f"Error collecting metric {name}: {e}")
+        return values
+
+    def render(self):
+        """
+        Format every metric in the Prometheus text format.
+        :return: Text of the /metrics page
+        """
+        lines = []
+        name = f"{self.prefix}_command_duration_seconds"
+        lines.append(f"# HELP {name} Time taken to handle a command.")
+        lines.append(f"# TYPE {name} histogram")
+        for command, histogram in sorted(self.commands.items()):
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                lines.append(f'{name}_bucket{{command="{command}",le="{le}"}} {cumulative}')
+            lines.append(f'{name}_sum{{command="{command}"}} {histogram.sum}')
+            lines.append(f'{name}_count{{command="{command}"}} {histogram.count}')
+
+        name = f"{self.prefix}_command_errors_total"
+        lines.append(f"# HELP {name} Commands that raised an error.")
+        lines.append(f"# TYPE {name} counter")
+        for command, count in sorted(self.command_errors.items()):
+            lines.append(f'{name}{{command="{command}"}} {count}')
+
+        values = self.collect()
+        for metric, kind, help, _, labels in self._collectors:
+            if metric not in values:
+                continue
+            name = f"{self.prefix}_{metric}"
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            value = values[metric]
+            if isinstance(value, dict):
+                for label_values, number in sorted(value.items(), key=lambda item: str(item[0])):
+                    if not isinstance(label_values, tuple):
+                        label_values = (label_values,)
+                    label_text = ",".join(f'{label}="{escape(str(label_value))}"' for label, label_value in zip(labels, label_values))
+                    lines.append(f"{name}{{{label_text}}} {float(number)}")
+            else:
+                lines.append(f"{name} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+    async def start_server(self, host="127.0.0.1", port=9108):
+        """
+        Serve the metrics on http://host:port/metrics. Safe to call more than once.
+        :params host: Address to listen on (localhost by default, so the metrics are not public)
+        :params port: Port to listen on
+        """
+        if self._runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle_metrics)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        self._runner = runner
+
+    async def _handle_metrics(self, request):
+        return web.Response(text=self.render(), content_type="text/plain", charset="utf-8")
+
+    async def close(self):
+        """
+        Stop the metrics server.
+        """
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+def escape(value):
+    """
+    Escape a Prometheus label value.
+    :params value: Label value
+    :return: Escaped value
+    """
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
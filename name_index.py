@@ -0,0 +1,193 @@
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+
+def normalize_name(name):
+    """
+    Normalize a name for matching: lowercase, no accents and collapsed whitespace.
+    :params name: Name to normalize
+    :return: Normalized name
+    """
+    name = unicodedata.normalize("NFKD", name.lower())
+    name = "".join(char for char in name if not unicodedata.combining(char))
+    return " ".join(name.split())
+
+def trigrams(name):
+    """
+    Get the trigrams of a name, padded so the start and end of words weigh more.
+    :params name: Normalized name
+    :return: Set of trigrams
+    """
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class NameIndex:
+    """
+    Trigram index over the names of the artists, albums, tracks and playlists the bot
+    has already seen in search results. Exact names are resolved locally without a
+    Spotify search. Close names are only used when Spotify finds nothing, because a
+    similar name is often a different item (e.g. "Jay Z" and "Jay"), and for the
+    "did you mean" suggestions.
+    """
+    def __init__(self, maxsize=5000, min_score=0.8, suggest_score=0.4):
+        """
+        :params maxsize: Maximum number of items kept, least recently used are evicted
+        :params min_score: Similarity (0 to 1) needed to use a close name when Spotify finds nothing
+        :params suggest_score: Similarity needed to suggest a name
+        """
+        self.maxsize = maxsize
+        self.min_score = min_score
+        self.suggest_score = suggest_score
+        self.entries = OrderedDict()
+        self.postings = {}
+        self.by_name = {}
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, maxsize=None, min_score=None):
+        """
+        Change the index settings.
+        :params maxsize: Maximum number of items kept
+        :params min_score: Similarity needed to use a close name when Spotify finds nothing
+        """
+        if maxsize is not None:
+            self.maxsize = maxsize
+            while len(self.entries) > self.maxsize:
+                self._remove(next(iter(self.entries)))
+        if min_score is not None:
+            self.min_score = min_score
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, search_type, item, age=0):
+        """
+        Index a Spotify item.
+        :params search_type: Type of the item (artist, album, playlist, track)
+        :params item: Spotify item with id and name
+        :params age: Seconds since Spotify returned the item (e.g. when read back from disk)
+        """
+        if not item or not item.get("id") or not item.get("name"):
+            return
+        key = (search_type, item["id"])
+        if key in self.entries:
+            self._remove(key)
+        name = normalize_name(item["name"])
+        grams = trigrams(name)
+        self.entries[key] = (name, grams, item, time.monotonic() - age)
+        self.by_name.setdefault((search_type, name), set()).add(key)
+        for gram in grams:
+            self.postings.setdefault((search_type, gram), set()).add(key)
+        if len(self.entries) > self.maxsize:
+            self._remove(next(iter(self.entries)))
+
+    def add_many(self, search_type, items):
+        """
+        Index a list of Spotify items, such as a page of search results.
+        :params search_type: Type of the items
+        :params items: List of Spotify items (None entries are skipped)
+        """
+        for item in items:
+            self.add(search_type, item)
+
+    def _remove(self, key):
+        name, grams, _, _ = self.entries.pop(key)
+        same_name = self.by_name.get((key[0], name))
+        if same_name is not None:
+            same_name.discard(key)
+            if not same_name:
+                del self.by_name[(key[0], name)]
+        for gram in grams:
+            posting = self.postings.get((key[0], gram))
+            if posting is not None:
+                posting.discard(key)
+                if not posting:
+                    del self.postings[(key[0], gram)]
+
+    def matches(self, search_type, query, limit=5, min_score=0.0):
+        """
+        Find the indexed items whose name is closest to a query.
+        :params search_type: Type of the items
+        :params query: Name to look for
+        :params limit: Maximum number of matches
+        :params min_score: Minimum similarity of a match
+        :return: List of (score, item), best first. Exact names score 1
+        """
+        name = normalize_name(query)
+        if not name:
+            return []
+        grams = trigrams(name)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.postings.get((search_type, gram), ()))
+
+        scored = []
+        for key, common in shared.items():
+            entry_name, entry_grams, item, _ = self.entries[key]
+            score = 1.0 if entry_name == name else 2 * common / (len(grams) + len(entry_grams))
+            if score >= min_score:
+                scored.append((score, item.get("popularity") or 0, key))
+        scored.sort(reverse=True)
+        return [(score, self.entries[key][2]) for score, _, key in scored[:limit]]
+
+    def resolve(self, search_type, query, max_age):
+        """
+        Resolve a name locally. Only exact names (ignoring case, accents and spacing) are resolved.
+        :params search_type: Type of the item
+        :params query: Name given by the user
+        :params max_age: Seconds an indexed item is trusted, so its data is not older than a cached search
+        :return: Spotify item, or None if the name is not indexed, is out of date, or is shared by several
+            items (Spotify's ranking then picks the right one)
+        """
+        keys = self.by_name.get((search_type, normalize_name(query)))
+        if not keys or len(keys) > 1:
+            self.misses += 1
+            return None
+        key = next(iter(keys))
+        if time.monotonic() - self.entries[key][3] >= max_age:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return self.entries[key][2]
+
+    def closest(self, search_type, query):
+        """
+        Find the closest indexed name, for when Spotify finds nothing (e.g. a badly misspelled name).
+        :params search_type: Type of the item
+        :params query: Name given by the user
+        :return: Spotify item, or None if no indexed name is similar enough
+        """
+        best = self.matches(search_type, query, limit=1, min_score=self.min_score)
+        if not best:
+            return None
+        item = best[0][1]
+        self.entries.move_to_end((search_type, item["id"]))
+        return item
+
+    def suggest(self, search_type, query, limit=3):
+        """
+        Get "did you mean" suggestions for a name.
+        :params search_type: Type of the item
+        :params query: Name given by the user
+        :params limit: Maximum number of suggestions
+        :return: List of distinct names
+        """
+        names = []
+        for _, item in self.matches(search_type, query, limit=limit * 3, min_score=self.suggest_score):
+            if item["name"] not in names:
+                names.append(item["name"])
+        return names[:limit]
+
+    def stats(self):
+        """
+        Get index counters.
+        :return: Dictionary with size, local hits, misses and hit ratio
+        """
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
@@ -0,0 +1,187 @@
+import asyncio
+import time
+import tracing
+from collections import deque
+
+class OutboundItem:
+    """
+    A queued Discord call: an embed to send or any other channel action (reaction, edit...).
+    """
+    def __init__(self, destination=None, embed=None, view=None, action=None):
+        """
+        :params destination: Context, user or channel the embed is sent to
+        :params embed: Discord embed to send
+        :params view: Discord view to attach to the message
+        :params action: Coroutine function to run instead of sending an embed
+        """
+        self.destination = destination
+        self.embed = embed
+        self.view = view
+        self.action = action
+        self.enqueued_at = time.monotonic()
+        self.future = asyncio.get_running_loop().create_future()
+
+    @property
+    def mergeable(self):
+        return self.action is None and self.view is None
+
+class Outbox:
+    """
+    Outbound Discord calls, queued per channel.
+    Calls are spaced to stay under Discord's per-channel rate limit, and
+    consecutive plain embeds for the same channel sent within a short window
+    are merged into a single message.
+    """
+    def __init__(self, rate=5, per=5.0, merge_window=0.05, max_embeds=10, max_chars=6000):
+        """
+        :params rate: Calls allowed per channel in each period
+        :params per: Length of the period, in seconds
+        :params merge_window: Seconds an embed waits for others to merge with
+        :params max_embeds: Maximum number of embeds in one message (Discord allows 10)
+        :params max_chars: Maximum total characters of the embeds in one message (Discord allows 6000)
+        """
+        self.rate = rate
+        self.per = per
+        self.merge_window = merge_window
+        self.max_embeds = max_embeds
+        self.max_chars = max_chars
+        self.sent = 0
+        self.queued = 0
+        self.merged = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.queues = {}
+        self._history = {}
+
+    def configure(self, rate=None, per=None, merge_window=None):
+        """
+        Change the outbox settings.
+        :params rate: Calls allowed per channel in each period
+        :params per: Length of the period, in seconds
+        :params merge_window: Seconds an embed waits for others to merge with
+        """
+        if rate is not None:
+            self.rate = rate
+        if per is not None:
+            self.per = per
+        if merge_window is not None:
+            self.merge_window = merge_window
+
+    async def send(self, channel_key, destination, embed, view=None):
+        """
+        Queue an embed.
+        :params channel_key: Key of the channel queue (channel id, or ("dm", user id))
+        :params destination: Context or user to send to
+        :params embed: Discord embed
+        :params view: Discord view to attach. Messages with a view are never merged
+        :return: Discord message that carries the embed
+        """
+        with tracing.span("discord.send", title=getattr(embed, "title", None)):
+            return await self._enqueue(channel_key, OutboundItem(destination, embed, view))
+
+    async def call(self, channel_key, action):
+        """
+        Queue another channel action, such as adding a reaction.
+        :params channel_key: Key of the channel queue
+        :params action: Coroutine function without arguments
+        :return: Result of the action
+        """
+        with tracing.span("discord.call"):
+            return await self._enqueue(channel_key, OutboundItem(action=action))
+
+    def depth(self, channel_key=None):
+        """
+        Get the number of queued calls.
+        :params channel_key: Key of a channel queue, all channels if not given
+        :return: Number of queued calls
+        """
+        if channel_key is not None:
+            return len(self.queues.get(channel_key, ()))
+        return sum(len(queue) for queue in self.queues.values())
+
+    def stats(self):
+        """
+        Get outbox counters.
+        :return: Dictionary with queue depth, active channels, Discord calls made, embeds merged into another message and wait times
+        """
+        return {
+            "depth": self.depth(),
+            "channels": len(self.queues),
+            "sent": self.sent,
+            "merged": self.merged,
+            "average_wait": self.total_wait / self.queued if self.queued else 0.0,
+            "max_wait": self.max_wait
+        }
+
+    async def _enqueue(self, channel_key, item):
+        queue = self.queues.get(channel_key)
+        if queue is None:
+            if len(self._history) > 1000:
+                self._forget_idle_channels()
+            queue = self.queues[channel_key] = deque()
+            queue.append(item)
+            asyncio.ensure_future(self._run(channel_key, queue))
+        else:
+            queue.append(item)
+        return await item.future
+
+    def _forget_idle_channels(self):
+        limit = time.monotonic() - self.per
+        for channel_key in [key for key, history in self._history.items() if not history or history[-1] <= limit]:
+            del self._history[channel_key]
+
+    async def _wait_turn(self, channel_key):
+        history = self._history.setdefault(channel_key, deque())
+        now = time.monotonic()
+        while history and history[0] <= now - self.per:
+            history.popleft()
+        if len(history) >= self.rate:
+            await asyncio.sleep(history[0] + self.per - now)
+            history.popleft()
+        history.append(time.monotonic())
+
+    async def _run(self, channel_key, queue):
+        try:
+            while queue:
+                await self._wait_turn(channel_key)
+                item = queue.popleft()
+                batch = [item]
+                if item.mergeable:
+                    delay = item.enqueued_at + self.merge_window - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    chars = len(item.embed)
+                    while queue and queue[0].mergeable and len(batch) < self.max_embeds and chars + len(queue[0].embed) <= self.max_chars:
+                        chars += len(queue[0].embed)
+                        batch.append(queue.popleft())
+                await self._execute(batch)
+        finally:
+            if self.queues.get(channel_key) is queue:
+                del self.queues[channel_key]
+
+    async def _execute(self, batch):
+        started = time.monotonic()
+        for item in batch:
+            wait = started - item.enqueued_at
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+        self.queued += len(batch)
+        self.sent += 1
+        self.merged += len(batch) - 1
+
+        first = batch[0]
+        try:
+            if first.action is not None:
+                result = await first.action()
+            elif len(batch) == 1:
+                result = await first.destination.send(embed=first.embed, view=first.view)
+            else:
+                result = await first.destination.send(embeds=[item.embed for item in batch])
+        except Exception as e:
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(e)
+            return
+        for item in batch:
+            if not item.future.done():
+                item.future.set_result(result)
@@ -1,8 +1,17 @@
 import random
-import bot
 import json
-import requests
-from requests import get
+import contextvars
+import spotify
+import cache
+import games
+import scores
+import views
+import outbox
+import snapshots
+import name_index
+import metrics
+import tracing
+import diagnostics
 import discord
 import time
 import asyncio
@@ -10,28 +19,173 @@ import re
 
 #################### SEARCH ####################
 
-def search_spotify(token, search_type, search_query):
+search_cache = cache.TTLCache(maxsize=1024, ttl=3600, negative_ttl=60)
+disk_cache = cache.DiskCache("spotify_cache.db")
+names = name_index.NameIndex(maxsize=5000, min_score=0.8)
+
+def normalize_query(search_query):
+    """
+    Normalize a search query so equivalent queries share a cache entry.
+    :params search_query: Query to normalize
+    :return: Lowercase query with collapsed whitespace
+    """
+    return " ".join(search_query.lower().split())
+
+async def search_spotify(token, search_type, search_query):
     """
     Search Spotify for a specific type (artist, album, playlist, track) with a query.
+    Names seen within the search cache ttl are resolved locally by the names index. When Spotify finds
+    nothing, the closest name already seen is used instead.
+    Results, including "not found", are kept in search_cache and disk_cache.
     :params token: Spotify API token
     :params search_type: Type of search (artist, album, playlist, track)
     :params search_query: Query to search for
     :return: JSON result of the search
     """
-    url = f"https://api.spotify.com/v1/search?q={search_query}&type={search_type}"
-    headers = bot.get_auth_header(token)
+    key = (search_type, normalize_query(search_query))
+    cached = search_cache.get(key)
+    if cached is not cache.MISSING:
+        return cached
+
+    result = names.resolve(search_type, search_query, max_age=search_cache.ttl)
+    if result is not None:
+        return result
+
+    disk_key = f"search:{search_type}:{key[1]}"
+    stored = await disk_cache.get(disk_key)
+    if stored is not None:
+        search_cache.set(key, stored["value"], ttl=stored["expires_at"] - time.time())
+        names.add(search_type, stored["value"], age=time.time() - stored["stored_at"])
+        return stored["value"]
+
+    url = f"{spotify.API_URL}/search"
+    params = {"q": search_query, "type": search_type}
     try:
-        response = get(url, headers=headers)
-        response.raise_for_status() 
-        json_result = response.json()[f"{search_type}s"]["items"]
+        response = await spotify.client.get(url, token, params=params)
+        response.raise_for_status()
+        json_result = [item for item in response.json()[f"{search_type}s"]["items"] if item is not None]
+        names.add_many(search_type, json_result)
+        result = json_result[0] if json_result else None
         for item in json_result:
             if item["name"].lower() == search_query.lower():
-                return item
-        return json_result[0] if json_result else None
-    except requests.RequestException as e:
+                result = item
+                break
+        if result is None:
+            # A guess from the index is cached as briefly as a "not found"
+            result = names.closest(search_type, search_query)
+            ttl = search_cache.negative_ttl
+        else:
+            ttl = search_cache.ttl
+        search_cache.set(key, result, ttl=ttl)
+        disk_cache.store(disk_key, result, ttl=ttl)
+        return result
+    except spotify.REQUEST_ERRORS as e:
         print(f"Error during Spotify search: {e}")
         return None
 
+async def send_not_found(ctx, search_type, search_query, text, is_private):
+    """
+    Send a "not found" error with "did you mean" suggestions from the names index.
+    :params ctx: Discord context
+    :params search_type: Type of search (artist, album, playlist, track)
+    :params search_query: Name given by the user
+    :params text: Error text
+    :params is_private: Boolean to check if the message should be sent via DM
+    """
+    await send(ctx, "Error", text + did_you_mean(search_type, search_query), "", "", is_private)
+
+def did_you_mean(search_type, search_query):
+    """
+    Build "did you mean" suggestions from the names index.
+    :params search_type: Type of search (artist, album, playlist, track)
+    :params search_query: Name given by the user
+    :return: Text with the suggestions, or an empty string if there are none
+    """
+    suggestions = names.suggest(search_type, search_query)
+    if not suggestions:
+        return ""
+    return " Did you mean: " + ", ".join(suggestions) + "?"
+
+#################### ENTITIES ####################
+
+entity_cache = cache.EntityCache(maxsize=512, ttl=300)
+
+artist_loader = spotify.BatchLoader("artists", "artists", max_batch=50)
+track_loader = spotify.BatchLoader("tracks", "tracks", max_batch=50)
+audio_features_loader = spotify.BatchLoader("audio-features", "audio_features", max_batch=100)
+
+batch_loaders = {"artists": artist_loader, "tracks": track_loader}
+
+#################### BROWSE ####################
+
+browse_data = snapshots.BrowseData(refresh_interval=3600)
+
+async def get_entity(token, kind, entity_id, params=None, priority=spotify.INTERACTIVE):
+    """
+    Get a Spotify object by ID (e.g. /v1/albums/{id}) through entity_cache.
+    Stale entries are revalidated with If-None-Match, or by comparing the
+    snapshot_id for playlists, so unchanged objects are not downloaded again.
+    Entries missing from memory are read from disk_cache before going to Spotify.
+    Artists and tracks that are not cached, or are stale without an ETag or
+    snapshot_id to revalidate them, are loaded through the batch loaders, so
+    lookups made at the same time share one multi-ID request.
+    :params token: Spotify API token
+    :params kind: Object type as used in the URL (albums, tracks, playlists...)
+    :params entity_id: Spotify ID of the object
+    :params params: Query parameters (e.g. fields, market)
+    :params priority: Rate limiter lane (spotify.INTERACTIVE or spotify.BULK)
+    :return: JSON object, or None if a batch loader does not know the ID
+    """
+    key = (kind, entity_id, tuple(sorted(params.items())) if params else ())
+    disk_key = f"entity:{kind}:{entity_id}:{key[2]}"
+    entry = entity_cache.get(key)
+    if entry is None:
+        stored = await disk_cache.get(disk_key)
+        if stored is not None:
+            fresh_for = stored["stored_at"] + entity_cache.ttl - time.time()
+            entity_cache.set(key, stored["value"], stored["etag"], stored["snapshot_id"], fresh_for=fresh_for)
+            entry = entity_cache.get(key)
+    if entity_cache.is_fresh(entry):
+        entity_cache.hits += 1
+        return entry["data"]
+
+    has_validator = entry is not None and (entry["etag"] or entry["snapshot_id"])
+    if not has_validator and not params and kind in batch_loaders:
+        entity_cache.misses += 1
+        data = await batch_loaders[kind].load(token, entity_id, priority)
+        if data is not None:
+            entity_cache.set(key, data)
+            disk_cache.store(disk_key, data)
+        return data
+
+    url = f"{spotify.API_URL}/{kind}/{entity_id}"
+    headers = {}
+    if entry is not None and entry["etag"]:
+        headers["If-None-Match"] = entry["etag"]
+    elif entry is not None and entry["snapshot_id"]:
+        snapshot_response = await spotify.client.get(url, token, params={"fields": "snapshot_id"}, priority=priority)
+        snapshot_response.raise_for_status()
+        if snapshot_response.json().get("snapshot_id") == entry["snapshot_id"]:
+            entity_cache.touch(key)
+            entity_cache.hits += 1
+            disk_cache.store(disk_key, entry["data"], snapshot_id=entry["snapshot_id"])
+            return entry["data"]
+
+    api_response = await spotify.client.get(url, token, headers=headers, params=params, priority=priority)
+    if api_response.status_code == 304 and entry is not None:
+        entity_cache.touch(key)
+        entity_cache.hits += 1
+        disk_cache.store(disk_key, entry["data"], etag=entry["etag"], snapshot_id=entry["snapshot_id"])
+        return entry["data"]
+    api_response.raise_for_status()
+
+    entity_cache.misses += 1
+    data = api_response.json()
+    etag = api_response.headers.get("ETag")
+    entity_cache.set(key, data, etag, data.get("snapshot_id"))
+    disk_cache.store(disk_key, data, etag=etag, snapshot_id=data.get("snapshot_id"))
+    return data
+
 #################### ARTIST ####################
 
 async def get_artist_info(ctx, token, artist_name, is_private):
@@ -43,9 +197,9 @@ async def get_artist_info(ctx, token, artist_name, is_private):
     :params is_private: Boolean to check if the message should be sent via DM
     """
     try:
-        artist_info = search_spotify(token, "artist", artist_name)
-        if artist_info == 0:
-            await send(ctx, "Error", "Artist not found or invalid artist name.", "", "", is_private)
+        artist_info = await search_spotify(token, "artist", artist_name)
+        if artist_info is None:
+            await send_not_found(ctx, "artist", artist_name, "Artist not found or invalid artist name.", is_private)
             return
         
         genres = ""
@@ -60,7 +214,7 @@ async def get_artist_info(ctx, token, artist_name, is_private):
         artist_name = artist_info['name']
         await send(ctx, f"{artist_name} Info", response, "", "", is_private)
     except Exception as e:
-        print(f"Error in get_artist_info: {e}")
+        command_failed("get_artist_info", e)
         await send(ctx, "Error", "An error occurred while fetching artist information.", "", "", is_private)
     
 async def get_albums_by_artist(ctx, token, artist_name, is_private):
@@ -72,32 +226,19 @@ async def get_albums_by_artist(ctx, token, artist_name, is_private):
     :params is_private: Boolean to check if the message should be sent via DM
     """
     try:
-        artist_info = search_spotify(token, "artist", artist_name)
-        if artist_info == 0:
-            await send(ctx, "Error", "Artist not found or invalid artist name.", "", "", is_private)
+        artist_info = await search_spotify(token, "artist", artist_name)
+        if artist_info is None:
+            await send_not_found(ctx, "artist", artist_name, "Artist not found or invalid artist name.", is_private)
             return
         
         artist_name = artist_info['name']
         artist_id = artist_info['id']
-        url = f"https://api.spotify.com/v1/artists/{artist_id}/albums"
-        querry_url =  url + "?include_groups=album"
-        headers = bot.get_auth_header(token)
-        api_response = get(querry_url, headers=headers)
-        artist_albums = json.loads(api_response.content)['items']
-
-        i = 0
-        response = ""
-        response += f"`Albums by {artist_name}:\n"
-        for album in artist_albums:
-            if i == len(artist_albums)-1:
-                response += "\t" + album['name'] + "`"
-            else:
-                response += "\t" + album['name'] + "\n"
-            i += 1
+        url = f"{spotify.API_URL}/artists/{artist_id}/albums"
+        load_page = spotify_pages(token, url, f"Albums by {artist_name}:", lambda album: album['name'], params={"include_groups": "album"})
 
-        await send(ctx, f"Albums By {artist_name}", response, "", "", is_private)
+        await send_pages(ctx, f"Albums By {artist_name}", load_page, is_private)
     except Exception as e:
-        print(f"Error in get_albums_by_artist: {e}")
+        command_failed("get_albums_by_artist", e)
         await send(ctx, "Error", "An error occurred while fetching artist albums.", "", "", is_private)
         
 async def get_top_tracks_by_artist(ctx, token, artist_name, is_private):
@@ -109,16 +250,16 @@ async def get_top_tracks_by_artist(ctx, token, artist_name, is_private):
     :params is_private: Boolean to check if the message should be sent via DM
     """
     try:
-        artist_info = search_spotify(token, "artist", artist_name)
-        if artist_info == 0:
-            await send(ctx, "Error", "Artist not found or invalid artist name.", "", "", is_private)
+        artist_info = await search_spotify(token, "artist", artist_name)
+        if artist_info is None:
+            await send_not_found(ctx, "artist", artist_name, "Artist not found or invalid artist name.", is_private)
             return   
 
         artist_name = artist_info['name']
         artist_id = artist_info['id']
-        url = f"https://api.spotify.com/v1/artists/{artist_id}/top-tracks?country=PT"
-        headers = bot.get_auth_header(token)
-        api_response = get(url, headers=headers)
+        url = f"{spotify.API_URL}/artists/{artist_id}/top-tracks?country=PT"
+        api_response = await spotify.client.get(url, token)
+        api_response.raise_for_status()
         top_tracks = json.loads(api_response.content)["tracks"]
 
         i = 0
@@ -134,7 +275,7 @@ async def get_top_tracks_by_artist(ctx, token, artist_name, is_private):
 
         await send(ctx, f"Top Tracks By {artist_name}", response, "", "", is_private)
     except Exception as e:
-        print(f"Error in get_top_tracks_by_artist: {e}")
+        command_failed("get_top_tracks_by_artist", e)
         await send(ctx, "Error", "An error occurred while fetching artist top tracks.", "", "", is_private)
 
 async def get_artist_related_artists(ctx, token, artist_name, is_private):
@@ -146,16 +287,16 @@ async def get_artist_related_artists(ctx, token, artist_name, is_private):
     :params is_private: Boolean to check if the message should be sent via DM
     """
     try:
-        artist_info = search_spotify(token, "artist", artist_name)
-        if artist_info == 0:
-            await send(ctx, "Error", "Artist not found or invalid artist name.", "", "", is_private)
+        artist_info = await search_spotify(token, "artist", artist_name)
+        if artist_info is None:
+            await send_not_found(ctx, "artist", artist_name, "Artist not found or invalid artist name.", is_private)
             return
 
         artist_id = artist_info['id']
         artist_name = artist_info['name']
-        url = f"https://api.spotify.com/v1/artists/{artist_id}/related-artists"
-        headers = bot.get_auth_header(token)
-        api_response = get(url, headers=headers)
+        url = f"{spotify.API_URL}/artists/{artist_id}/related-artists"
+        api_response = await spotify.client.get(url, token)
+        api_response.raise_for_status()
         related_artists = json.loads(api_response.content)["artists"]
 
         i = 0
@@ -171,7 +312,7 @@ async def get_artist_related_artists(ctx, token, artist_name, is_private):
 
         await send(ctx, f"Related Artists To {artist_name}", response, "", "", is_private)
     except Exception as e:
-        print(f"Error in get_artist_related_artists: {e}")
+        command_failed("get_artist_related_artists", e)
         await send(ctx, "Error", "An error occurred while fetching artist related artists.", "", "", is_private)
 
 #################### ALBUM #################### 
@@ -185,36 +326,40 @@ async def get_album_info(ctx, token, album_name, is_private):
     :params is_private: Boolean to check if the message should be sent via DM
     """
     try:
-        album_info = search_spotify(token, "album", album_name)
-        if album_info == 0:
-            await send(ctx, "Error", "Album not found or invalid album name.", "", "", is_private)
+        album_info = await search_spotify(token, "album", album_name)
+        if album_info is None:
+            await send_not_found(ctx, "album", album_name, "Album not found or invalid album name.", is_private)
             return
         
-        url = f"https://api.spotify.com/v1/albums/{album_info['id']}"
-        headers = bot.get_auth_header(token)
-        api_response = get(url, headers=headers)
-        album_info= json.loads(api_response.content)
-
-        artists = ""
-        for artist in album_info["artists"]:
-            artists += artist["name"] + ", "
-        tracks = ""
-        for track in album_info["tracks"]["items"]:
-            tracks += "\t" + str(track["track_number"]) + ": " + track["name"] + "\n"
-
-        response = "`Name: " + album_info["name"] + "\n" \
-            "Artists: " + artists[:len(artists)-2] + "\n" \
-            "Release Date: " + album_info["release_date"] + "\n" \
-            "Tracks:\n" + tracks[:len(tracks)-1] + "\n" \
-            "Popularity: " + str(album_info["popularity"]) + "\n" \
-            "Label: " + album_info["label"] + "`"
-        
-        await send(ctx, album_info["name"]+" Info", response, "", "", is_private)
+        album_info = await get_entity(token, "albums", album_info['id'])
+        tracks_url = f"{spotify.API_URL}/albums/{album_info['id']}/tracks"
+        more_tracks = spotify_pages(token, tracks_url, "Tracks:", lambda track: str(track["track_number"]) + ": " + track["name"])
+
+        async def load_page(page):
+            if page > 0:
+                return await more_tracks(page)
+
+            artists = ""
+            for artist in album_info["artists"]:
+                artists += artist["name"] + ", "
+            tracks = ""
+            for track in album_info["tracks"]["items"][:PAGE_SIZE]:
+                tracks += "\t" + str(track["track_number"]) + ": " + track["name"] + "\n"
+
+            response = "`Name: " + album_info["name"] + "\n" \
+                "Artists: " + artists[:len(artists)-2] + "\n" \
+                "Release Date: " + album_info["release_date"] + "\n" \
+                "Tracks:\n" + tracks[:len(tracks)-1] + "\n" \
+                "Popularity: " + str(album_info["popularity"]) + "\n" \
+                "Label: " + album_info["label"] + "`"
+            return response, album_info["tracks"]["total"] > PAGE_SIZE
+
+        await send_pages(ctx, album_info["name"]+" Info", load_page, is_private)
     except Exception as e:
-        print(f"Error in get_album_info: {e}")
+        command_failed("get_album_info", e)
         await send(ctx, "Error", "An error occurred while fetching album information.", "", "", is_private)
 
-async def get_new_album_releases(ctx, token, country, is_private): ### A BIT BROKEN WORKS BEST FOR country=US
+async def get_new_album_releases(ctx, token, country, is_private):
     """
     Get new album releases.
     :params ctx: Discord context
@@ -223,64 +368,23 @@ async def get_new_album_releases(ctx, token, country, is_private): ### A BIT BRO
     :params is_private: Boolean to check if the message should be sent via DM
     """
     try:
-        url = "https://api.spotify.com/v1/browse/new-releases"
-        if country != "":
-            url += f"?country={country}"
-        headers = bot.get_auth_header(token)
-        api_response = get(url, headers=headers)
-
-        if api_response.status_code != 200:
-            return "Please provide a valide country. For more informations type '!help'."
-        
-        new_album_releases = json.loads(api_response.content)
+        try:
+            new_releases = await browse_data.get_new_releases(token, country)
+        except spotify.SpotifyError as e:
+            if e.status_code in [400, 404]:
+                await send(ctx, "Error", "Please provide a valid country. For more informations type '#help'.", "", "", is_private)
+                return
+            raise
 
-        limit = 0
-        for item in new_album_releases["albums"]["items"]:
-            if item["album_type"] == "album":
-                limit += 1
-
-        i = 0
-        response = ""
-        for name in new_album_releases["albums"]["items"]:
-            if name["album_type"] == "album":
-                if i == 0:
-                    response += "`New Albums:\n"
-                elif i == limit-1:
-                    response += "\t" + name["name"] + " - " + name["artists"][0]["name"] + " - " + name["release_date"] + "`"
-                else:
-                    response += "\t" + name["name"] + " - " + name["artists"][0]["name"] + " - " + name["release_date"] + "\n"
-            
-                i += 1
+        albums = [album["name"] + " - " + album["artist"] + " - " + album["release_date"] for album in new_releases.get("album", [])]
 
-        await send(ctx, "New Album Releases "+country, response, "", "", is_private)
+        await send_pages(ctx, "New Album Releases "+country, views.list_pages("New Albums:", albums, PAGE_SIZE), is_private)
     except Exception as e:
-        print(f"Error in get_new_album_releases: {e}")
+        command_failed("get_new_album_releases", e)
         await send(ctx, "Error", "An error occurred while fetching new album releases.", "", "", is_private)
 
 #################### CATEGORIES ####################   
 
-def get_categories(token):
-    """
-    Get all categories.
-    :params token: Spotify API token
-    :return: List of categories
-    """
-    try: 
-        url = "https://api.spotify.com/v1/browse/categories"
-        headers = bot.get_auth_header(token)
-        api_response = get(url, headers=headers)
-
-        category_data = json.loads(api_response.content)
-
-        categories_names = []
-        for category in category_data["categories"]["items"]:
-            categories_names.append([category["id"], category["name"]])
-
-        return categories_names
-    except Exception as e:
-        print(f"Error in get_categories: {e}")
-        return None
-
 async def show_categories(ctx, token, is_private):
     """
     Show all categories.
@@ -289,23 +393,12 @@ async def show_categories(ctx, token, is_private):
     :params is_private: Boolean to check if the message should be sent via DM
     """
     try: 
-        categories_list = get_categories(token)
-
-        i = 0
-        response = ""
-        for category in categories_list:
-            if i == 0:
-                response += "`Categories:\n"
-            elif i == len(categories_list)-1:
-                response += "\t" + category[1] + "`"
-            else:
-                response += "\t" + category[1] + "\n"
+        categories = await browse_data.get_categories(token)
+        names = [category["name"] for category in categories["items"]]
 
-            i += 1
-        
-        await send(ctx, "Spotify Categories", response, "", "", is_private)
+        await send_pages(ctx, "Spotify Categories", views.list_pages("Categories:", names, PAGE_SIZE), is_private)
     except Exception as e:
-        print(f"Error in show_categories: {e}")
+        command_failed("show_categories", e)
         await send(ctx, "Error", "An error occurred while fetching spotify categories.", "", "", is_private)
 
 #################### GENRES ####################
@@ -318,30 +411,57 @@ async def get_genres(ctx, token, is_private):
     :params is_private: Boolean to check if the message should be sent via DM
     """
     try:
-        url = "https://api.spotify.com/v1/recommendations/available-genre-seeds"
-        headers = bot.get_auth_header(token)
-        api_response = get(url, headers=headers)
-        genre_data = json.loads(api_response.content)
-
-        i = 0
-        response = ""
-        for genre in genre_data["genres"]:
-            if i == 0:
-                response += "`Genres:\n"
-            elif i == len(genre_data["genres"])-1:
-                response += "\t" + genre + "`"
-            else:
-                response += "\t" + genre + "\n"
-            
-            i += 1
+        genres = await browse_data.get_genres(token)
 
-        await send(ctx, "Spotify Genres", response, "", "", is_private)
+        await send_pages(ctx, "Spotify Genres", views.list_pages("Genres:", genres, PAGE_SIZE), is_private)
     except Exception as e:
-        print(f"Error in get_genres: {e}")
+        command_failed("get_genres", e)
         await send(ctx, "Error", "An error occurred while fetching spotify genres.", "", "", is_private)
 
 #################### PLAYLIST ####################
 
+PLAYLIST_GAME_FIELDS = "items(track(name,popularity,artists(id,name))),next,total"
+
+async def read_playlist_tracks(token, playlist_id, fields=PLAYLIST_GAME_FIELDS, page_size=100, priority=spotify.INTERACTIVE):
+    """
+    Read every item of a playlist, page by page, as an async generator.
+    Once the first page tells the total, the remaining pages are fetched concurrently.
+    If the total is not known the next links are followed instead.
+    :params token: Spotify API token
+    :params playlist_id: Spotify ID of the playlist
+    :params fields: Spotify fields filter, only these fields are downloaded
+    :params page_size: Number of items per page (max 100)
+    :params priority: Rate limiter lane of the page requests
+    :return: Async generator of playlist items
+    """
+    path = f"{playlist_id}/tracks"
+    page = await get_entity(token, "playlists", path, params={"fields": fields, "limit": page_size, "offset": 0}, priority=priority)
+    for item in page.get("items", []):
+        yield item
+
+    total = page.get("total")
+    if total is None:
+        while page.get("next"):
+            response = await spotify.client.get(page["next"], token, priority=priority)
+            response.raise_for_status()
+            page = response.json()
+            for item in page.get("items", []):
+                yield item
+        return
+
+    tasks = [
+        asyncio.ensure_future(get_entity(token, "playlists", path, params={"fields": fields, "limit": page_size, "offset": offset}, priority=priority))
+        for offset in range(page_size, total, page_size)
+    ]
+    try:
+        for task in tasks:
+            page = await task
+            for item in page.get("items", []):
+                yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+
 async def get_playlist_info(ctx, token, playlist_name, is_private):
     """
     Get information about a playlist.
@@ -351,15 +471,12 @@ async def get_playlist_info(ctx, token, playlist_name, is_private):
     :params is_private: Boolean to check if the message should be sent via DM
     """
     try:
-        playlist_info = search_spotify(token, "playlist", playlist_name)
-        if playlist_info == 0:
-            await send(ctx, "Error", "Playlist not found or invalid playlist name.", "", "", is_private)
+        playlist_info = await search_spotify(token, "playlist", playlist_name)
+        if playlist_info is None:
+            await send_not_found(ctx, "playlist", playlist_name, "Playlist not found or invalid playlist name.", is_private)
             return
 
-        url = f"https://api.spotify.com/v1/playlists/{playlist_info['id']}"
-        headers = bot.get_auth_header(token)
-        api_response = get(url, headers=headers)
-        playlist_info = json.loads(api_response.content)
+        playlist_info = await get_entity(token, "playlists", playlist_info['id'])
 
         response = "`Name: " + playlist_info["name"] + "\n" \
             "Owner: " + playlist_info["owner"]["display_name"] + "\n" \
@@ -370,7 +487,7 @@ async def get_playlist_info(ctx, token, playlist_name, is_private):
         
         await send(ctx, playlist_info["name"]+" Info", response, "", "", is_private)
     except Exception as e:
-        print(f"Error in get_playlist_info: {e}")
+        command_failed("get_playlist_info", e)
         await send(ctx, "Error", "An error occurred while fetching playlist information.", "", "", is_private)
 
 async def get_spotify_featured_playlists(ctx, token, is_private):
@@ -381,24 +498,12 @@ async def get_spotify_featured_playlists(ctx, token, is_private):
     :params is_private: Boolean to check if the message should be sent via DM
     """
     try:
-        url = "https://api.spotify.com/v1/browse/featured-playlists"
-        headers = bot.get_auth_header(token)
-        api_response = get(url, headers=headers)
-        featuredPlaylists = json.loads(api_response.content)
-
-        i = 0
-        response = "`Playlists: " + "\n"
-        for playlist in featuredPlaylists["playlists"]["items"]:
-            if i == len(featuredPlaylists["playlists"]["items"]) - 1:
-                response += "\t" + playlist["name"] + " - " + playlist["owner"]["display_name"] + "`"
-            else:
-                response += "\t" + playlist["name"] + " - " + playlist["owner"]["display_name"] + "\n"
+        featured_playlists = await browse_data.get_featured_playlists(token)
+        playlists = [playlist["name"] + " - " + playlist["owner"] for playlist in featured_playlists]
 
-            i += 1
-
-        await send(ctx, "Spotify Featured Playlists", response, "", "", is_private)
+        await send_pages(ctx, "Spotify Featured Playlists", views.list_pages("Playlists:", playlists, PAGE_SIZE), is_private)
     except Exception as e:
-        print(f"Error in get_spotify_featured_playlists: {e}")
+        command_failed("get_spotify_featured_playlists", e)
         await send(ctx, "Error", "An error occurred while fetching spotify featured playlists.", "", "", is_private)
 
 
@@ -411,17 +516,13 @@ async def get_spotify_categories_playlists(ctx, token, category_id, is_private):
     :params is_private: Boolean to check if the message should be sent via DM
     """
     try:
-        categories_list = get_categories(token)
         if category_id == "":
-            random_number = random.randint(0, len(categories_list)-1)
-            category_id = categories_list[random_number][0]
+            categories = await browse_data.get_categories(token)
+            category_id = random.choice(categories["items"])["id"]
         else:
-            for categories in categories_list:
-                if categories[1].lower() == category_id:
-                    category_id = categories[0]
-        url = f"https://api.spotify.com/v1/browse/categories/{category_id}/playlists?limit=50"
-        headers = bot.get_auth_header(token)
-        api_response = get(url, headers=headers)
+            category_id = await browse_data.get_category_id(token, category_id) or category_id
+        url = f"{spotify.API_URL}/browse/categories/{category_id}/playlists?limit=50"
+        api_response = await spotify.client.get(url, token)
         if api_response.status_code != 200:
             return "Please provide a valid category name."
         
@@ -431,7 +532,7 @@ async def get_spotify_categories_playlists(ctx, token, category_id, is_private):
 
         await get_playlist_info(ctx, token, playlists["playlists"]["items"][random_number]["name"], is_private)
     except Exception as e:
-        print(f"Error in get_spotify_categories_playlists: {e}")
+        command_failed("get_spotify_categories_playlists", e)
         await send(ctx, "Error", "An error occurred while fetching spotify categories playlists.", "", "", is_private)
 
 #################### TRACKS ####################
@@ -445,15 +546,12 @@ async def get_track_info(ctx, token, track_name, is_private):
     :params is_private: Boolean to check if the message should be sent via DM
     """
     try: 
-        track_info = search_spotify(token, "track", track_name)
-        if track_info == 0:
-            await send(ctx, "Error", "Track not found or invalid track name.", "", "", is_private)
+        track_info = await search_spotify(token, "track", track_name)
+        if track_info is None:
+            await send_not_found(ctx, "track", track_name, "Track not found or invalid track name.", is_private)
             return
 
-        url = f"https://api.spotify.com/v1/tracks/{track_info['id']}"
-        headers = bot.get_auth_header(token)
-        api_response = get(url, headers=headers)
-        track_info = json.loads(api_response.content)
+        track_info = await get_entity(token, "tracks", track_info['id'])
 
         artists = ""
         for artist in track_info["artists"]:
@@ -468,7 +566,7 @@ async def get_track_info(ctx, token, track_name, is_private):
         
         await send(ctx, track_info["name"]+" Info", response, "", "", is_private)
     except Exception as e:
-        print(f"Error in get_track_info: {e}")
+        command_failed("get_track_info", e)
         await send(ctx, "Error", "An error occurred while fetching track information.", "", "", is_private)
 
 async def get_track_features(ctx, token, track_name, is_private):
@@ -480,16 +578,13 @@ async def get_track_features(ctx, token, track_name, is_private):
     :params is_private: Boolean to check if the message should be sent via DM
     """
     try:
-        track_info = search_spotify(token, "track", track_name)
-        if track_info == 0:
-            await send(ctx, "Error", "Track not found or invalid track name.", "", "", is_private)
+        track_info = await search_spotify(token, "track", track_name)
+        if track_info is None:
+            await send_not_found(ctx, "track", track_name, "Track not found or invalid track name.", is_private)
             return
         
         track_name = track_info['name']
-        url = f"https://api.spotify.com/v1/audio-features?ids={track_info['id']}"
-        headers = bot.get_auth_header(token)
-        api_response = get(url, headers=headers)
-        track_info = json.loads(api_response.content)
+        track_info = {"audio_features": [await audio_features_loader.load(token, track_info['id'])]}
 
         keysList = ["C", "C#/Db", "D", "D#/Eb", "E", "F", "F#/Gb","G", "G#/Ab", "A", "A#/Bb", "B"]
 
@@ -510,7 +605,7 @@ async def get_track_features(ctx, token, track_name, is_private):
         
         await send(ctx, track_name+" Features", response, "", "", is_private)
     except Exception as e:
-        print(f"Error in get_track_features: {e}")
+        command_failed("get_track_features", e)
         await send(ctx, "Error", "An error occurred while fetching track features.", "", "", is_private)
         
 async def get_track_features_help(ctx, features_list, is_private):
@@ -558,6 +653,21 @@ async def get_track_features_help(ctx, features_list, is_private):
 
     await send(ctx, "Track Features Help", response, "", "", is_private)
 
+async def get_genre_seeds(token, genres_names):
+    """
+    Get the valid genre seeds, only if the user gave genres.
+    :params token: Spotify API token
+    :params genres_names: Genres given by the user
+    :return: Set of valid genre seeds, or None if they could not be loaded (the genres are then used unchecked)
+    """
+    if not genres_names:
+        return set()
+    try:
+        return set(await browse_data.get_genres(token))
+    except spotify.REQUEST_ERRORS as e:
+        print(f"Error in get_genre_seeds: {e}")
+        return None
+
 async def get_recomendations(ctx, token, message, is_private):
     """
     Get tracks recommendations based on artists, genres, and tracks.
@@ -574,36 +684,68 @@ async def get_recomendations(ctx, token, message, is_private):
             await send(ctx, "Error", "The number of results must be greater than 0 and less than 100", "", "", is_private)
             return
         
-        artists_names = [name.strip() for name in parts[1].split(',')] if len(parts) > 1 else []
-        genres_names = [name.strip() for name in parts[2].split(',')] if len(parts) > 2 else []
-        tracks_names = [name.strip() for name in parts[3].split(',')] if len(parts) > 3 else []
+        artists_names = [name.strip() for name in parts[1].split(',') if name.strip()] if len(parts) > 1 else []
+        genres_names = [name.strip() for name in parts[2].split(',') if name.strip()] if len(parts) > 2 else []
+        tracks_names = [name.strip() for name in parts[3].split(',') if name.strip()] if len(parts) > 3 else []
 
         if len(artists_names) + len(genres_names) + len(tracks_names) > 5:
             await send(ctx, "Error", "The sum of artists, genres, and tracks must not be greater than 5", "", "", is_private)
             return 
 
-        artistsID = ','.join([search_spotify(token, "artist", artist)['id'] for artist in artists_names if artist])
-        genresID = ','.join(genres_names)
-        tracksID = ','.join([search_spotify(token, "track", track)['id'] for track in tracks_names if track])
+        artists, tracks, available_genres = await asyncio.gather(
+            asyncio.gather(*(search_spotify(token, "artist", artist) for artist in artists_names)),
+            asyncio.gather(*(search_spotify(token, "track", track) for track in tracks_names)),
+            get_genre_seeds(token, genres_names)
+        )
+
+        unresolved = []
+        for name, artist in zip(artists_names, artists):
+            if artist is None:
+                unresolved.append(f"Artist not found: {name}." + did_you_mean("artist", name))
+        for name, track in zip(tracks_names, tracks):
+            if track is None:
+                unresolved.append(f"Track not found: {name}." + did_you_mean("track", name))
+        if available_genres is None:
+            available_genres = set(genres_names)
+        for genre in genres_names:
+            if genre not in available_genres:
+                unresolved.append(f"Genre not found: {genre}. Type #genres to see the valid genres.")
+
+        params = {
+            "limit": number_of_results,
+            "seed_artists": ','.join(artist['id'] for artist in artists if artist is not None),
+            "seed_genres": ','.join(genre for genre in genres_names if genre in available_genres),
+            "seed_tracks": ','.join(track['id'] for track in tracks if track is not None)
+        }
+
+        if unresolved:
+            await send(ctx, "Some seeds were skipped", "\n".join(unresolved), "", "", is_private)
+        if not (params["seed_artists"] or params["seed_genres"] or params["seed_tracks"]):
+            if not unresolved:
+                await send(ctx, "Error", "Give at least one artist, genre or track to base the recommendations on.", "", "", is_private)
+            return
 
-        url = f"https://api.spotify.com/v1/recommendations?limit={number_of_results}&seed_artists={artistsID}&seed_genres={genresID}&seed_tracks={tracksID}"
-        headers = bot.get_auth_header(token)
-        api_response = requests.get(url, headers=headers)
+        url = f"{spotify.API_URL}/recommendations"
+        api_response = await spotify.client.get(url, token, params=params)
         api_response.raise_for_status()
         song_recommendations = api_response.json()
 
-        response = "`Song recommendations:\n"
+        lines = []
         for idx, recommendation in enumerate(song_recommendations["tracks"]):
-            response += f"{idx + 1}. {recommendation['name']} - {recommendation['artists'][0]['name']}\n"
-        response += "`"
+            lines.append(f"{idx + 1}. {recommendation['name']} - {recommendation['artists'][0]['name']}")
 
-        await send(ctx, "Recommended Tracks", response, "", "", is_private)
+        await send_pages(ctx, "Recommended Tracks", views.list_pages("Song recommendations:", lines, PAGE_SIZE), is_private)
     except Exception as e:
-        print(f"Error in get_recomendations: {e}")
+        command_failed("get_recomendations", e)
         await send(ctx, "Error", "An error occurred while fetching recommendations.", "", "", is_private)
 
 #################### OTHER ####################
 
+PAGE_SIZE = 20
+PAGE_TIMEOUT = 180
+
+send_queue = outbox.Outbox(rate=5, per=5.0, merge_window=0.05)
+
 async def help(ctx, is_private):
     """
     Show all commands.
@@ -617,7 +759,7 @@ async def help(ctx, is_private):
     response += "\t" + "#toptracks " + "artist_name" + "\n"
     response += "\t" + "#relatedartists " + "artist_name" + "\n"
     response += "\t" + "#album " + "album_name" + "\n"
-    response += "\t" + "#newreleases " + "country (e.g. PT, US - works best for US)" + "\n"
+    response += "\t" + "#newreleases " + "country (e.g. PT, US)" + "\n"
     response += "\t" + "#categories" + "\n"
     response += "\t" + "#genres" + "\n"
     response += "\t" + "#playlist " + "playlist_name" + "\n"
@@ -629,20 +771,22 @@ async def help(ctx, is_private):
     response += "\t- #recommendations number_of_results | artists | genres | tracks\n"
     response += "\t\tExample: #recommendations 10 | Taylor Sift | pop, rock | Bad Blood, Shape of You\n"
     response += "\t\tNote: At least one of 'artists', 'genres', or 'tracks' is required. The sum of them can't be more than 5.\n"
-    response += "\t" + "#game " + "playlist_name/playlis_url " + "mode=songs/artists" + "\n"
+    response += "\t" + "#game " + "playlist_name/playlis_url " + "mode=songs/artists " + "display=buttons/reactions (optional - buttons by default)" + "\n"
+    response += "\t" + "#leaderboard " + "[global/songs/artists/playlist_name] (optional - if not given shows this server)" + "\n"
+    response += "\t" + "#stats " + "(admins only)" + "\n"
+    response += "\t" + "#profile " + "[seconds/stop] (admins only)" + "\n"
     response += "\t" + "Note: If before every command you insert '?' the information will be sent to you via DM" + "`"
     
     await send(ctx, "Help:", response, "", "", is_private)
 
-async def send(ctx, title, description, field, value, is_private):
+def make_embed(title, description, field, value):
     """
-    Create the message embed and send it.
-    :params ctx: Discord context
+    Create a message embed in the bot's style.
     :params title: Title of the embed
     :params description: Description of the embed
     :params field: Field of the embed
     :params value: Value of the embed
-    :params is_private: Boolean to check if the message should be sent via DM
+    :return: Discord embed
     """
     embed = discord.Embed(
         title=title,
@@ -654,26 +798,76 @@ async def send(ctx, title, description, field, value, is_private):
         field = "⇨ " +field
         embed.add_field(name=field, value=value, inline=True)
 
+    return embed
+
+async def send(ctx, title, description, field, value, is_private, view=None):
+    """
+    Create the message embed and queue it in the send queue of its channel.
+    :params ctx: Discord context
+    :params title: Title of the embed
+    :params description: Description of the embed
+    :params field: Field of the embed
+    :params value: Value of the embed
+    :params is_private: Boolean to check if the message should be sent via DM
+    :params view: Discord view (buttons) to attach to the message
+    """
+    embed = make_embed(title, description, field, value)
+
     if is_private:
-        message = await ctx.author.send(embed=embed)
+        message = await send_queue.send(("dm", ctx.author.id), ctx.author, embed, view)
     else:
-        message = await ctx.send(embed=embed)
+        message = await send_queue.send(ctx.channel.id, ctx, embed, view)
 
     return message
 
-#################### GAME ####################
+async def send_pages(ctx, title, load_page, is_private):
+    """
+    Send a listing that may have several pages. Buttons are only added if there is more than one page.
+    :params ctx: Discord context
+    :params title: Title of the embed
+    :params load_page: Coroutine function taking a page number and returning (text, has_next)
+    :params is_private: Boolean to check if the message should be sent via DM
+    :return: Discord message
+    """
+    text, has_next = await load_page(0)
+    if not has_next:
+        return await send(ctx, title, text, "", "", is_private)
+
+    view = views.PaginatedView(title, load_page, text, has_next, timeout=PAGE_TIMEOUT)
+    message = await send(ctx, title, text, "", "", is_private, view=view)
+    view.message = message
+    return message
 
-async def get_artist_info_for_game(token, artist_name):
+def spotify_pages(token, url, header, render_item, params=None, list_key=None):
     """
-    Get artist info.
+    Build a page loader over a paginated Spotify endpoint. Each page is requested only when it is shown.
     :params token: Spotify API token
-    :params artist_name: Name of the artist
+    :params url: Endpoint url
+    :params header: First line of every page
+    :params render_item: Function that turns an item into a line
+    :params params: Extra query parameters
+    :params list_key: Key of the paging object in the response, if it is not the top level
+    :return: Coroutine function taking a page number and returning (text, has_next)
     """
-    info = search_spotify(token, "artist", artist_name)
-    if info == 0:
-      return "Please provide a valid artist name."
-    
-    return info
+    async def load_page(page):
+        page_params = dict(params or {})
+        page_params.update({"limit": PAGE_SIZE, "offset": page * PAGE_SIZE})
+        api_response = await spotify.client.get(url, token, params=page_params)
+        api_response.raise_for_status()
+        data = api_response.json()
+        if list_key is not None:
+            data = data[list_key]
+        return views.format_page(header, [render_item(item) for item in data["items"]]), data.get("next") is not None
+    return load_page
+
+#################### GAME ####################
+
+game_manager = games.GameManager(round_delay=1)
+reaction_collector = games.ReactionCollector()
+game_view = None
+score_store = scores.ScoreStore("scores.db", legacy_path="high_scores.txt")
+leaderboards = scores.Leaderboards(size=10)
+ROUND_DURATION = 5
 
 async def get_playlist_info_for_game(ctx, token, playlist_name, url, mode):
     """
@@ -683,90 +877,75 @@ async def get_playlist_info_for_game(ctx, token, playlist_name, url, mode):
     :params playlist_name: Name of the playlist
     :params url: Boolean to check if the playlist name is a url
     :params mode: Mode of the game. Can be "songs" or "artists"    
+    :return: List of names with their popularity and the playlist name, or (None, None) if the playlist could not be read
     """
     if not url:
-        info = search_spotify(token, "playlist", playlist_name)
+        with tracing.span("game.search_playlist"):
+            info = await search_spotify(token, "playlist", playlist_name)
         if info == None:
-            await send(ctx, "Something went wrong", "Check the playlist url or the name you have provided.", "", "", False)
-            return
-        url = f"https://api.spotify.com/v1/playlists/{info['id']}"
+            return None, None
+        playlist_id = info['id']
     else: 
         playlist_id = playlist_name.split('/')[-1]
         playlist_id = playlist_id.split('?')[0]
-        url = f"https://api.spotify.com/v1/playlists/{playlist_id}"
-
-    headers = bot.get_auth_header(token)
-    api_response = get(url, headers=headers)
-    if api_response == None:
-        await send(ctx, "Something went wrong", "Check the playlist url or the name you have provided.", "", "", False)
-        return
-    playlistInfo = json.loads(api_response.content)
 
-    if mode == "songs":
-        track_names_and_popularity = []
+    if mode not in ["songs", "artists"]:
+        return None, None
 
-        for track_item in playlistInfo.get("tracks", {}).get("items", []):
-            track = track_item.get("track")
-            if track:
-                track_name = track.get("name")
-                track_popularity = track.get("popularity")
-                if track_name is not None and track_popularity is not None:
-                    track_names_and_popularity.append({"name": track_name, "popularity": track_popularity})
+    track_names_and_popularity = []
+    artist_ids = set()
+    artist_tasks = []
+    try:
+        playlistInfo = await get_entity(token, "playlists", playlist_id, params={"fields": "name,snapshot_id"})
+        if mode == "artists":
+            await send(ctx, "Please standby.", "The game will start in a few seconds.", "", "", False)
+
+        with tracing.span("game.read_tracks"):
+            async for track_item in read_playlist_tracks(token, playlist_id, priority=spotify.BULK):
+                track = track_item.get("track")
+                if not track:
+                    continue
+                if mode == "songs":
+                    track_name = track.get("name")
+                    track_popularity = track.get("popularity")
+                    if track_name is not None and track_popularity is not None:
+                        track_names_and_popularity.append({"name": track_name, "popularity": track_popularity})
+                else:
+                    track_artist = track.get("artists")
+                    if track_artist and track_artist[0].get("id") is not None and track_artist[0]["id"] not in artist_ids:
+                        artist_ids.add(track_artist[0]["id"])
+                        artist_tasks.append(asyncio.ensure_future(get_entity(token, "artists", track_artist[0]["id"], priority=spotify.BULK)))
+    except spotify.REQUEST_ERRORS as e:
+        print(f"Error in get_playlist_info_for_game: {e}")
+        for task in artist_tasks:
+            task.cancel()
+        return None, None
 
+    if mode == "songs":
         return track_names_and_popularity, playlistInfo["name"]
-    elif mode == "artists":
-        await send(ctx, "Please standby.", "The game will start in a few seconds.", "", "", False)
-        artist_names = set()
-        for track_item in playlistInfo.get("tracks", {}).get("items", []):
-            track = track_item.get("track")
-            if track:
-                track_artist = track.get("artists")
-                if track_artist is not None:
-                    artist_name = track_artist[0].get("name")
-                    artist_names.add(artist_name)
-        
-        artist_info_list = []
-        for artist_name in artist_names:
-            artist_info = await get_artist_info_for_game(token, artist_name)
-            if artist_info:
-                if artist_info.get("name") is not None and artist_info.get("popularity") is not None:
-                    artist_info_list.append({"name": artist_name, "popularity": artist_info["popularity"]})
-
-        return artist_info_list, playlistInfo["name"]
-    else:
-        return None, playlistInfo["name"]
 
-def load_high_scores():
-    """
-    Load high scores from a text file
-    :return: List of high scores
-    """
-    high_scores = []
-    try:
-        with open("high_scores.txt", "r") as file:
-            for line in file:
-                player, score, playlist, mode = line.strip().split(":")
-                high_scores.append({"player": player, "score": int(score), "playlist": playlist, "mode": mode})
-    except FileNotFoundError:
-        pass
-    return high_scores
+    artist_info_list = []
+    with tracing.span("game.artist_lookups", artists=len(artist_tasks)):
+        artist_infos = await asyncio.gather(*artist_tasks, return_exceptions=True)
+    errors = [artist_info for artist_info in artist_infos if isinstance(artist_info, BaseException)]
+    if errors:
+        print(f"Error in get_playlist_info_for_game: skipped {len(errors)} artists: {errors[0]}")
+    for artist_info in artist_infos:
+        if artist_info and not isinstance(artist_info, BaseException):
+            if artist_info.get("name") is not None and artist_info.get("popularity") is not None:
+                artist_info_list.append({"name": artist_info["name"], "popularity": artist_info["popularity"]})
 
-def save_high_scores(high_scores):
-    """
-    Save high scores to a text file
-    """
-    with open("high_scores.txt", "w") as file:
-        for score_data in high_scores:
-            file.write(f"{score_data['player']}:{score_data['score']}:{score_data['playlist']}:{score_data['mode']}\n")
+    return artist_info_list, playlistInfo["name"]
 
-def print_highest_scores(highest_scores):
+def print_highest_scores(highest_scores, title="Top 10 High Scores"):
     """
     Print highest scores.
-    :params highest_scores: List of highest scores
+    :params highest_scores: List of highest scores, already sorted from a leaderboard
+    :params title: First line of the message
     :return: String with the highest scores
     """
-    highest_scores_message = "Top 10 High Scores:\n"
-    for idx, score_data in enumerate(sorted(highest_scores, key=lambda x: x["score"], reverse=True)[:10]):
+    highest_scores_message = f"{title}:\n"
+    for idx, score_data in enumerate(highest_scores):
         highest_scores_message += f"{idx + 1}. {score_data['player']}: {score_data['score']} (Playlist: {score_data['playlist']}) (Mode: {score_data['mode']})\n"
     return highest_scores_message
 
@@ -795,180 +974,460 @@ def print_all_points(players_scores):
 
 async def game(ctx, tokenSpotify, playlist_name):
     """
-    Represents a higher or lower game.
+    Represents a higher or lower game. Checks the options and starts the game in game_manager.
     :params ctx: Discord context
     :params tokenSpotify: Spotify API token
     :params playlist_name: Name of the playlist
     """
-    pattern = r"(.*?)(?: mode=(\w+))?$"
-    match = re.search(pattern, playlist_name)
-    if match:
-        playlist_name = match.group(1).strip()
-        mode = match.group(2) if match.group(2) else None
-    else:
-        await send(ctx, "Something went wrong", "Check the playlist url or the name you have provided. Make sure you also specify a mode.", "", "", False)
-        return    
+    options = dict(re.findall(r"(?:^|\s)(mode|display)=(\w+)", playlist_name))
+    playlist_name = re.sub(r"(?:^|\s)(?:mode|display)=\w+", "", playlist_name).strip()
+    mode = options.get("mode")
+    display = options.get("display", "buttons")
 
-    if mode == None:
+    if mode == None or playlist_name == "":
         await send(ctx, "Something went wrong", "Check the playlist url or the name you have provided. Make sure you also specify a mode.", "", "", False)
         return
 
+    if display not in games.DISPLAYS:
+        await send(ctx, "Something went wrong", "Invalid display. Use display=buttons or display=reactions.", "", "", False)
+        return
+
+    if game_manager.is_running(ctx.channel.id):
+        await send(ctx, "A game is already running", "Wait for the current game in this channel to finish.", "", "", False)
+        return
+
+    state = games.GameState(ctx.channel.id, playlist_name, mode, display)
+    game_manager.start(state, play_game(ctx, tokenSpotify, state))
+
+async def play_game(ctx, tokenSpotify, state):
+    """
+    Play the rounds of a higher or lower game. Runs as its own task in game_manager.
+    :params ctx: Discord context
+    :params tokenSpotify: Spotify API token
+    :params state: GameState of the game
+    """
+    playlist_name = state.playlist_name
+    mode = state.mode
+
     url_mode = False
     if playlist_name.startswith("https://"):
         url_mode = True
 
-    if url_mode:
-        info, actual_playlist_name = await get_playlist_info_for_game(ctx, tokenSpotify, playlist_name, True, mode)
-    else:
-        playlist_name = playlist_name.lower()
-        info, actual_playlist_name = await get_playlist_info_for_game(ctx, tokenSpotify, playlist_name, False, mode)
+    message = getattr(ctx, "message", None)
+    with tracing.tracer.trace(message.id if message is not None else None, "game_start", mode=mode, display=state.display, channel_id=ctx.channel.id):
+        if url_mode:
+            info, actual_playlist_name = await get_playlist_info_for_game(ctx, tokenSpotify, playlist_name, True, mode)
+        else:
+            playlist_name = playlist_name.lower()
+            info, actual_playlist_name = await get_playlist_info_for_game(ctx, tokenSpotify, playlist_name, False, mode)
 
     if info == [] or info == None:
         await send(ctx, "Something went wrong", "Check the playlist url or the name you have provided.", "", "", False)
         return
 
-    highest_scores = load_high_scores()
-    players_scores = {}
-    num_rounds = len(info)
-    songs_chosen = []
-    current_index = random.randint(0, len(info) - 1)
-    songs_chosen.append(current_index)
-    next_index = 0
-    participants = []
-    first_round = True
-
-    while (num_rounds > 0):
-        players_to_remove = []
-
-        if len(info) < 2:
-            await send(ctx, "Invalid playlist size.", "Please make sure your playlist has more tan 1 song.", "", "", False)
-            break
-
-        current_item = info[current_index]
-        next_index = random.randint(0, len(info) - 1)
-        while next_index in songs_chosen:
-            next_index = random.randint(0, len(info) - 1)
-        songs_chosen.append(next_index)
-
-        next_item = info[next_index]
-        current_index = next_index
-
-        game_message = f"Is the popularity of '{current_item['name']}' higher or lower than '{next_item['name']}'?"
-        message = await send(ctx, game_message, "", "", "", False)
+    if len(info) < 2:
+        await send(ctx, "Invalid playlist size.", "Please make sure your playlist has more tan 1 song.", "", "", False)
+        return
 
-        await message.add_reaction('⬆️')
-        await message.add_reaction('⬇️')
+    state.deck = games.GameDeck(info)
+    board = None
+    last_result = ""
 
-        is_higher = current_item['popularity'] > next_item['popularity']
+    while (state.deck.remaining() > 0):
+        players_to_remove = []
+        game_round = state.deck.next_round()
 
-        round_participants_reactions = {}
+        if state.display == "buttons":
+            embed = make_embed(game_round.prompt, last_result, "Points table", print_all_points(state.players_scores) or "Vote with the buttons below!")
+            board = await show_game_board(ctx, board, embed, get_game_view())
+            votes = reaction_collector.open_round(board.id, [games.HIGHER, games.LOWER], ROUND_DURATION)
+        else:
+            message = await send(ctx, game_round.prompt, "", "", "", False)
+            votes = reaction_collector.open_round(message.id, [games.HIGHER, games.LOWER], ROUND_DURATION)
 
-        while True:
             try:
-                reaction, user = await ctx.bot.wait_for('reaction_add', timeout=5.0)
-                if user.name not in participants and first_round:
-                    participants.append(user.name)
-                    players_scores[user.name] = 0
-                if user.name not in round_participants_reactions and reaction.emoji in ['⬆️', '⬇️']:
-                    round_participants_reactions[user.name] = reaction.emoji
-            except asyncio.TimeoutError:
-                break
+                await send_queue.call(ctx.channel.id, lambda: message.add_reaction(games.HIGHER))
+                await send_queue.call(ctx.channel.id, lambda: message.add_reaction(games.LOWER))
+            except Exception:
+                reaction_collector.close_round(message.id)
+                raise
+
+        round_participants_reactions = await reaction_collector.collect(votes)
+        if state.first_round:
+            for user_name in round_participants_reactions:
+                if user_name not in state.participants:
+                    state.participants.append(user_name)
+                    state.players_scores[user_name] = 0
             
-        for participant in participants:
+        for participant in state.participants:
             if (participant not in round_participants_reactions):
                 players_to_remove.append(participant)
-            elif (is_higher and '⬆️' == round_participants_reactions[participant]) or \
-               (not is_higher and '⬇️' == round_participants_reactions[participant]):
-                players_scores[participant] += 1
+            elif game_round.is_correct(round_participants_reactions[participant]):
+                state.players_scores[participant] += 1
             else:
                 players_to_remove.append(participant)
 
         for player in players_to_remove:
-            participants.remove(player)        
+            state.participants.remove(player)        
 
-        await send(ctx, "Round Over!", print_player_lost(players_to_remove), "Points table", print_all_points(players_scores), False)
+        if state.display == "buttons":
+            last_result = print_player_lost(players_to_remove)
+        else:
+            await send(ctx, "Round Over!", print_player_lost(players_to_remove), "Points table", print_all_points(state.players_scores), False)
 
-        if participants == []:
+        if state.participants == []:
             break
 
-        first_round = False
-        num_rounds -= 1
+        state.round += 1
 
-        time.sleep(1)
+        await game_manager.wait_round()
     
-    for participant, score in players_scores.items():
-        if len(highest_scores) < 10 or score > min(highest_scores, key=lambda x: x["score"])["score"]:
-            new_high_score = {"player": participant, "score": score, "playlist": actual_playlist_name, "mode": mode}
-            highest_scores.append(new_high_score)
-            if len(highest_scores) > 10:
-                highest_scores.remove(min(highest_scores, key=lambda x: x["score"]))
+    guild_id = ctx.guild.id if ctx.guild is not None else None
+    game_scores = [
+        {"player": participant, "score": score, "playlist": actual_playlist_name, "mode": mode, "guild_id": guild_id}
+        for participant, score in state.players_scores.items()
+    ]
+    await leaderboards.ensure_loaded(score_store)
+    await score_store.add_scores(game_scores)
+    for score_data in game_scores:
+        leaderboards.add(score_data)
+    highest_scores = leaderboards.top("global")
+
+    if board is not None:
+        embed = make_embed("Game over! Thanks for playing.", last_result, "Points table", print_all_points(state.players_scores) or "Nobody played this game.")
+        embed.add_field(name="⇨ Highest Scores", value=print_highest_scores(highest_scores) or "No scores yet.", inline=True)
+        await show_game_board(ctx, board, embed, None)
+    else:
+        await send(ctx, "Game over! Thanks for playing.", "", "Highest Scores", print_highest_scores(highest_scores), False)
+
+def get_game_view():
+    """
+    Get the persistent higher/lower buttons shared by every game.
+    :return: GameVoteView that routes votes to reaction_collector
+    """
+    global game_view
+    if game_view is None:
+        game_view = views.GameVoteView(reaction_collector.feed, games.HIGHER, games.LOWER)
+    return game_view
+
+async def show_game_board(ctx, board, embed, view):
+    """
+    Show the game message: sent on the first round and edited in place afterwards,
+    so a round costs a single Discord call.
+    :params ctx: Discord context
+    :params board: Game message, or None if it was not sent yet
+    :params embed: Discord embed to show
+    :params view: Discord view to attach, or None to remove the buttons
+    :return: Game message
+    """
+    if board is None:
+        return await send_queue.send(ctx.channel.id, ctx, embed, view)
+    await send_queue.call(ctx.channel.id, lambda: board.edit(embed=embed, view=view))
+    return board
+
 
-    save_high_scores(highest_scores)
+async def show_leaderboard(ctx, board, is_private):
+    """
+    Show a leaderboard. Without a board name the leaderboard of the current server is shown.
+    :params ctx: Discord context
+    :params board: "global", a game mode ("songs"/"artists"), a playlist name, or "" for this server
+    :params is_private: Boolean to check if the message should be sent via DM
+    """
+    try:
+        await leaderboards.ensure_loaded(score_store)
+        if board == "" and ctx.guild is not None:
+            title = f"Top 10 in {ctx.guild.name}"
+            highest_scores = leaderboards.top("guild", ctx.guild.id)
+        elif board in ["", "global"]:
+            title = "Top 10 High Scores"
+            highest_scores = leaderboards.top("global")
+        elif board in ["songs", "artists"]:
+            title = f"Top 10 in mode {board}"
+            highest_scores = leaderboards.top("mode", board)
+        else:
+            title = f"Top 10 for playlist {board}"
+            highest_scores = leaderboards.top("playlist", board)
 
-    await send(ctx, "Game over! Thanks for playing.", "", "Highest Scores", print_highest_scores(highest_scores), False)
+        if highest_scores == []:
+            await send(ctx, "Leaderboard", "No scores yet. Play a #game to get on the board!", "", "", is_private)
+            return
 
+        await send(ctx, "Leaderboard", print_highest_scores(highest_scores, title), "", "", is_private)
+    except Exception as e:
+        command_failed("show_leaderboard", e)
+        await send(ctx, "Error", "An error occurred while fetching the leaderboard.", "", "", is_private)
 
-#################### HANDLE RESPONSES ####################
+#################### STATS ####################
 
-async def handle_responses(ctx, tokenSpotify, message, is_private):
+stats = metrics.Metrics(prefix="spotify_bot")
+admin_ids = set()
+_command_errors = contextvars.ContextVar("command_errors", default=None)
+loop_monitor = diagnostics.LoopMonitor(threshold=0.25)
+profiler = diagnostics.SamplingProfiler()
+
+def cache_stats():
     """
-    Handle all responses.
+    :return: Dictionary of cache name to its stats
+    """
+    return {
+        "search": search_cache.stats(),
+        "entities": entity_cache.stats(),
+        "disk": disk_cache.stats(),
+        "names": names.stats()
+    }
+
+stats.add_counter("spotify_requests_total", "Spotify API calls by endpoint and status.", lambda: spotify.client.calls, labels=("endpoint", "status"))
+stats.add_counter("spotify_retries_total", "Spotify API calls retried after a 429, 5xx or connection error.", lambda: spotify.client.retries)
+stats.add_counter("spotify_throttled_total", "Spotify API calls answered with 429.", lambda: spotify.client.throttled)
+stats.add_counter("spotify_coalesced_total", "Spotify API calls saved by sharing an identical request in flight.", lambda: spotify.client.coalesced)
+stats.add_gauge("spotify_limiter_queued", "Spotify API calls waiting for the rate limiter.", lambda: spotify.client.limiter.queued())
+stats.add_counter("discord_calls_total", "Discord calls made by the send queue.", lambda: send_queue.sent)
+stats.add_counter("discord_merged_embeds_total", "Embeds merged into another message.", lambda: send_queue.merged)
+stats.add_gauge("discord_queue_depth", "Discord calls waiting in the send queue.", lambda: send_queue.depth())
+stats.add_gauge("active_games", "Games running.", lambda: game_manager.active_count())
+stats.add_counter("cache_hits_total", "Cache hits by cache.", lambda: {name: values["hits"] for name, values in cache_stats().items()}, labels=("cache",))
+stats.add_counter("cache_misses_total", "Cache misses by cache.", lambda: {name: values["misses"] for name, values in cache_stats().items()}, labels=("cache",))
+stats.add_gauge("cache_hit_ratio", "Cache hit ratio by cache.", lambda: {name: values["hit_ratio"] for name, values in cache_stats().items()}, labels=("cache",))
+stats.add_gauge("event_loop_lag_seconds", "How late the last event loop heartbeat woke up.", lambda: loop_monitor.lag)
+stats.add_gauge("event_loop_max_lag_seconds", "Largest event loop heartbeat delay seen.", lambda: loop_monitor.max_lag)
+stats.add_counter("event_loop_stalls_total", "Times the event loop was blocked longer than the threshold.", lambda: loop_monitor.stalls)
+
+def command_failed(where, e):
+    """
+    Log an error caught by a command handler and count the command as failed in the stats.
+    :params where: Name of the handler
+    :params e: Exception caught
+    """
+    print(f"Error in {where}: {e}")
+    errors = _command_errors.get()
+    if errors is not None:
+        errors.append(e)
+
+def is_admin(ctx):
+    """
+    Check if the author of a command is a bot admin, listed in admin_ids. Server
+    administrators are not bot admins: the stats cover every server the bot is in.
+    :params ctx: Discord context
+    :return: True if the author is an admin
+    """
+    return ctx.author.id in admin_ids
+
+async def show_stats(ctx, is_private):
+    """
+    Show the bot metrics. Only for admins.
     :params ctx: Discord context
-    :params tokenSpotify: Spotify API token
-    :params message: Message with the command
     :params is_private: Boolean to check if the message should be sent via DM
     """
-    p_message = message.lower()
+    if not is_admin(ctx):
+        await send(ctx, "Error", "Only admins can see the bot stats.", "", "", is_private)
+        return
 
-    if p_message.startswith('#artist'):
-        await get_artist_info(ctx, tokenSpotify, p_message[8:], is_private)
-    
-    elif p_message.startswith('#albums'):
-        await get_albums_by_artist(ctx, tokenSpotify, p_message[8:], is_private)
-    
-    elif p_message.startswith('#toptracks'):
-        await get_top_tracks_by_artist(ctx, tokenSpotify, p_message[11:], is_private)
-    
-    elif p_message.startswith('#relatedartists'):
-        await get_artist_related_artists(ctx, tokenSpotify, p_message[15:], is_private)
+    lines = []
+    for command, histogram in sorted(stats.commands.items(), key=lambda item: -item[1].count):
+        lines.append(f"{command}: {histogram.count} runs, p50 <= {histogram.quantile(0.5) * 1000:.0f}ms, p99 <= {histogram.quantile(0.99) * 1000:.0f}ms, errors {stats.command_errors.get(command, 0)}")
+    response = views.format_page("Commands:", lines or ["No commands yet."])
+
+    client_stats = spotify.client.stats()
+    queue_stats = send_queue.stats()
+    response += "\n`Spotify:\n" \
+        f"\tCalls: {client_stats['calls']}, 429s: {client_stats['throttled']}, retries: {client_stats['retries']}, coalesced: {client_stats['coalesced']}\n" \
+        "Discord:\n" \
+        f"\tCalls: {queue_stats['sent']}, merged embeds: {queue_stats['merged']}, queued: {queue_stats['depth']}, max wait: {queue_stats['max_wait']:.1f}s\n" \
+        f"Active games: {game_manager.active_count()}\n" \
+        f"Event loop: lag {loop_monitor.lag * 1000:.0f}ms, max {loop_monitor.max_lag * 1000:.0f}ms, stalls: {loop_monitor.stalls}\n" \
+        "Caches:\n" + \
+        "\n".join(f"\t{name}: {values['hit_ratio']:.0%} hits ({values['hits']}/{values['hits'] + values['misses']})" for name, values in cache_stats().items()) + "`"
+
+    await send(ctx, "Bot Stats", response, "", "", is_private)
+
+async def profile(ctx, option, is_private):
+    """
+    Start or stop the sampling profiler of the event loop. Only for admins.
+    The result is written to a file and its hottest functions are sent when profiling ends.
+    :params ctx: Discord context
+    :params option: Number of seconds to profile (30 by default), or "stop"
+    :params is_private: Boolean to check if the message should be sent via DM
+    """
+    if not is_admin(ctx):
+        await send(ctx, "Error", "Only admins can run the profiler.", "", "", is_private)
+        return
 
-    elif p_message.startswith('#album'):
-        await get_album_info(ctx, tokenSpotify, p_message[7:], is_private)
-    
-    elif p_message.startswith('#newreleases'):
-        await get_new_album_releases(ctx, tokenSpotify, p_message[13:].upper(), is_private)
-    
-    elif p_message.startswith('#categories'):
-        await show_categories(ctx, tokenSpotify, is_private)
-    
-    elif p_message.startswith('#genres'):
-        await get_genres(ctx, tokenSpotify, is_private)
-    
-    elif p_message.startswith('#playlist'):
-        await get_playlist_info(ctx, tokenSpotify, p_message[10:], is_private)
-    
-    elif p_message.startswith('#featuredplaylists'):
-        await get_spotify_featured_playlists(ctx, tokenSpotify, is_private)
-    
-    elif p_message.startswith('#categoryplaylist'):  
-        await get_spotify_categories_playlists(ctx, tokenSpotify, p_message[18:], is_private)
-    
-    elif p_message.startswith('#track'):
-        await get_track_info(ctx, tokenSpotify, p_message[7:], is_private)
-    
-    elif p_message.startswith('#featurestrack'):
-        await get_track_features(ctx, tokenSpotify, p_message[15:], is_private)
-    
-    elif p_message.startswith('#infotrackfeatures'):
-        await get_track_features_help(ctx, p_message[18:], is_private)
+    if option == "stop":
+        if not profiler.running:
+            await send(ctx, "Error", "The profiler is not running.", "", "", is_private)
+            return
+        profiler.stop()
+        return
 
-    elif p_message.startswith('#recomendations'):  
-        await get_recomendations(ctx, tokenSpotify, p_message[15:], is_private)
+    if profiler.running:
+        await send(ctx, "Error", "The profiler is already running. Use #profile stop to end it.", "", "", is_private)
+        return
+    try:
+        seconds = float(option) if option else 30.0
+    except ValueError:
+        seconds = 0
+    if seconds <= 0:
+        await send(ctx, "Error", "Please provide the number of seconds to profile, or stop.", "", "", is_private)
+        return
 
-    elif p_message == '#help':
-        await help(ctx, is_private)
+    done = profiler.start(seconds)
+    await send(ctx, "Profiler", f"Profiling the bot for {min(seconds, profiler.max_duration):g} seconds.", "", "", is_private)
+    asyncio.ensure_future(send_profile(ctx, done, is_private))
 
-    elif p_message.startswith('#game'):
-        await game(ctx, tokenSpotify, p_message[6:])
-    
+async def send_profile(ctx, done, is_private):
+    """
+    Wait for the profiler to finish and send its summary.
+    :params ctx: Discord context
+    :params done: Future returned by profiler.start
+    :params is_private: Boolean to check if the message should be sent via DM
+    """
+    try:
+        summary = await done
+    except Exception as e:
+        print(f"Error in profile: {e}")
+        await send(ctx, "Error", "An error occurred while writing the profile.", "", "", is_private)
+        return
 
+    lines = [f"{share:.0%} {name}" for name, share in summary["top"]]
+    response = views.format_page("Hottest functions:", lines or ["No samples."])
+    response += f"\n`{summary['samples']} samples in {summary['seconds']:.1f}s, saved to {summary['path']}`"
+    await send(ctx, "Profile", response, "", "", is_private)
+
+#################### HANDLE RESPONSES ####################
+
+def no_args(text):
+    """
+    Parser for commands without arguments.
+    :params text: Text after the command
+    :return: Empty tuple
+    """
+    return ()
+
+def text_arg(text):
+    """
+    Parser for commands that take a name.
+    :params text: Text after the command
+    :return: Tuple with the lowercase text
+    """
+    return (text.lower(),)
+
+def country_arg(text):
+    """
+    Parser for commands that take a country code.
+    :params text: Text after the command
+    :return: Tuple with the uppercase text
+    """
+    return (text.upper(),)
+
+def game_arg(text):
+    """
+    Parser for the game command. Playlist urls keep their case because Spotify IDs are case sensitive.
+    :params text: Text after the command
+    :return: Tuple with the game options
+    """
+    return (" ".join(word if word.startswith("https://") else word.lower() for word in text.split()),)
+
+class Command:
+    """
+    Entry of the command table: the handler and how its arguments are built.
+    """
+    def __init__(self, handler, parser=text_arg, uses_token=True, allows_private=True):
+        """
+        :params handler: Coroutine that runs the command
+        :params parser: Function that turns the text after the command into handler arguments
+        :params uses_token: Boolean to check if the handler takes the Spotify token
+        :params allows_private: Boolean to check if the handler takes the is_private flag
+        """
+        self.handler = handler
+        self.parser = parser
+        self.uses_token = uses_token
+        self.allows_private = allows_private
+
+    async def run(self, ctx, tokenSpotify, text, is_private):
+        """
+        Run the command.
+        :params ctx: Discord context
+        :params tokenSpotify: Spotify API token
+        :params text: Text after the command
+        :params is_private: Boolean to check if the message should be sent via DM
+        """
+        args = [ctx]
+        if self.uses_token:
+            args.append(tokenSpotify)
+        args.extend(self.parser(text))
+        if self.allows_private:
+            args.append(is_private)
+        await self.handler(*args)
+
+COMMANDS = {
+    "#artist": Command(get_artist_info),
+    "#albums": Command(get_albums_by_artist),
+    "#toptracks": Command(get_top_tracks_by_artist),
+    "#relatedartists": Command(get_artist_related_artists),
+    "#album": Command(get_album_info),
+    "#newreleases": Command(get_new_album_releases, country_arg),
+    "#categories": Command(show_categories, no_args),
+    "#genres": Command(get_genres, no_args),
+    "#playlist": Command(get_playlist_info),
+    "#featuredplaylists": Command(get_spotify_featured_playlists, no_args),
+    "#categoryplaylist": Command(get_spotify_categories_playlists),
+    "#track": Command(get_track_info),
+    "#featurestrack": Command(get_track_features),
+    "#infotrackfeatures": Command(get_track_features_help, uses_token=False),
+    "#recomendations": Command(get_recomendations),
+    "#recommendations": Command(get_recomendations),
+    "#help": Command(help, no_args, uses_token=False),
+    "#game": Command(game, game_arg, allows_private=False),
+    "#leaderboard": Command(show_leaderboard, uses_token=False),
+    "#stats": Command(show_stats, no_args, uses_token=False),
+    "#profile": Command(profile, uses_token=False),
+}
+
+def split_command(message):
+    """
+    Split a message into its command token and the rest of the text.
+    :params message: Message sent by the user
+    :return: Lowercase command token and the text after it
+    """
+    parts = message.strip().split(maxsplit=1)
+    if not parts:
+        return "", ""
+    return parts[0].lower(), parts[1] if len(parts) > 1 else ""
+
+def is_command(message):
+    """
+    Cheap check, done before building a Discord context, to know if a message is a bot command.
+    :params message: Message sent by the user (may start with '?')
+    :return: True if the message starts with a known command
+    """
+    if message.startswith('?'):
+        message = message[1:]
+    if not message.startswith('#'):
+        return False
+    return split_command(message)[0] in COMMANDS
+
+async def handle_responses(ctx, tokenSpotify, message, is_private):
+    """
+    Handle all responses.
+    :params ctx: Discord context
+    :params tokenSpotify: Spotify API token
+    :params message: Message with the command
+    :params is_private: Boolean to check if the message should be sent via DM
+    """
+    name, text = split_command(message)
+    command = COMMANDS.get(name)
+    if command is None:
+        return
+
+    started = time.perf_counter()
+    errors = []
+    token = _command_errors.set(errors)
+    try:
+        with tracing.span("handle_responses", command=name, private=is_private):
+            await command.run(ctx, tokenSpotify, text, is_private)
+    except Exception as e:
+        errors.append(e)
+        raise
+    finally:
+        _command_errors.reset(token)
+        stats.observe_command(name, time.perf_counter() - started, bool(errors))
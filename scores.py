@@ -0,0 +1,294 @@
+import asyncio
+import heapq
+import itertools
+import os
+import sqlite3
+import threading
+import time
+
+class ScoreStore:
+    """
+    Transactional store of game scores in SQLite (WAL mode).
+    Every call runs in a worker thread with its own connection, so games that
+    finish at the same time never overwrite each other and the event loop is not blocked.
+    """
+    def __init__(self, path="scores.db", legacy_path="high_scores.txt"):
+        """
+        :params path: Path of the SQLite database
+        :params legacy_path: Old high_scores.txt file, imported once on first use
+        """
+        self.path = path
+        self.legacy_path = legacy_path
+        self._ready = False
+        self._lock = threading.Lock()
+
+    def configure(self, path=None, legacy_path=None):
+        """
+        Change the store files. Must be called before the first use.
+        :params path: Path of the SQLite database
+        :params legacy_path: Old high_scores.txt file
+        """
+        if path is not None:
+            self.path = path
+        if legacy_path is not None:
+            self.legacy_path = legacy_path
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _setup(self):
+        if self._ready:
+            return
+        with self._lock:
+            if self._ready:
+                return
+            connection = self._connect()
+            try:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS scores ("
+                    "id INTEGER PRIMARY KEY, player TEXT NOT NULL, score INTEGER NOT NULL, "
+                    "playlist TEXT NOT NULL, mode TEXT NOT NULL, guild_id INTEGER, created_at REAL NOT NULL)"
+                )
+                connection.execute("CREATE INDEX IF NOT EXISTS scores_mode_playlist_score ON scores (mode, playlist, score DESC)")
+                connection.execute("CREATE INDEX IF NOT EXISTS scores_guild_score ON scores (guild_id, score DESC)")
+                connection.execute("CREATE INDEX IF NOT EXISTS scores_score ON scores (score DESC)")
+                connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+                self._import_legacy(connection)
+            finally:
+                connection.close()
+            self._ready = True
+
+    def _import_legacy(self, connection):
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            if connection.execute("SELECT 1 FROM meta WHERE key = 'legacy_imported'").fetchone() is None:
+                rows = []
+                if self.legacy_path and os.path.exists(self.legacy_path):
+                    with open(self.legacy_path, "r") as file:
+                        for line in file:
+                            score_data = parse_legacy_line(line)
+                            if score_data is not None:
+                                rows.append((score_data["player"], score_data["score"], score_data["playlist"], score_data["mode"], None, time.time()))
+                connection.executemany(
+                    "INSERT INTO scores (player, score, playlist, mode, guild_id, created_at) VALUES (?, ?, ?, ?, ?, ?)", rows
+                )
+                connection.execute("INSERT INTO meta (key, value) VALUES ('legacy_imported', ?)", (str(len(rows)),))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def _add_scores(self, scores):
+        self._setup()
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.executemany(
+                "INSERT INTO scores (player, score, playlist, mode, guild_id, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [(s["player"], s["score"], s["playlist"], s["mode"], s.get("guild_id"), time.time()) for s in scores]
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        finally:
+            connection.close()
+
+    def _top_scores(self, limit, mode, playlist, guild_id):
+        self._setup()
+        query = "SELECT player, score, playlist, mode, guild_id FROM scores"
+        conditions = []
+        values = []
+        if mode is not None:
+            conditions.append("mode = ?")
+            values.append(mode)
+        if playlist is not None:
+            conditions.append("playlist = ?")
+            values.append(playlist)
+        if guild_id is not None:
+            conditions.append("guild_id = ?")
+            values.append(guild_id)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY score DESC, id ASC LIMIT ?"
+        values.append(limit)
+
+        connection = self._connect()
+        try:
+            rows = connection.execute(query, values).fetchall()
+        finally:
+            connection.close()
+        return [{"player": row[0], "score": row[1], "playlist": row[2], "mode": row[3], "guild_id": row[4]} for row in rows]
+
+    def _top_scores_per(self, column, limit):
+        self._setup()
+        query = (
+            f"SELECT player, score, playlist, mode, guild_id FROM ("
+            f"SELECT *, ROW_NUMBER() OVER (PARTITION BY {column} ORDER BY score DESC, id ASC) AS position FROM scores"
+            f") WHERE position <= ?"
+        )
+        connection = self._connect()
+        try:
+            rows = connection.execute(query, (limit,)).fetchall()
+        finally:
+            connection.close()
+        return [{"player": row[0], "score": row[1], "playlist": row[2], "mode": row[3], "guild_id": row[4]} for row in rows]
+
+    async def add_scores(self, scores):
+        """
+        Save the scores of a finished game in one transaction.
+        :params scores: List of dictionaries with player, score, playlist, mode and guild_id
+        """
+        if scores:
+            await asyncio.to_thread(self._add_scores, scores)
+
+    async def top_scores(self, limit=10, mode=None, playlist=None, guild_id=None):
+        """
+        Get the highest scores, optionally filtered.
+        :params limit: Number of scores to return
+        :params mode: Only scores of this game mode
+        :params playlist: Only scores of this playlist
+        :params guild_id: Only scores of this guild
+        :return: List of score dictionaries, highest first
+        """
+        return await asyncio.to_thread(self._top_scores, limit, mode, playlist, guild_id)
+
+    async def top_scores_per(self, column, limit=10):
+        """
+        Get the highest scores of every group (e.g. every mode or every guild).
+        :params column: Column to group by (mode, playlist or guild_id)
+        :params limit: Number of scores kept per group
+        :return: List of score dictionaries
+        """
+        if column not in ["mode", "playlist", "guild_id"]:
+            raise ValueError(f"Invalid score column: {column}")
+        return await asyncio.to_thread(self._top_scores_per, column, limit)
+
+class Leaderboard:
+    """
+    Top-K scores kept in a bounded min-heap, updated one score at a time.
+    """
+    def __init__(self, size=10):
+        """
+        :params size: Number of scores kept
+        """
+        self.size = size
+        self._heap = []
+        self._counter = itertools.count()
+
+    def add(self, score_data):
+        """
+        Add a score if it belongs in the top K.
+        :params score_data: Score dictionary
+        :return: True if the board changed
+        """
+        # Older scores win ties, so newer entries get a lower tiebreaker
+        entry = (score_data["score"], -next(self._counter), score_data)
+        if len(self._heap) < self.size:
+            heapq.heappush(self._heap, entry)
+            return True
+        if entry[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, entry)
+            return True
+        return False
+
+    def top(self):
+        """
+        :return: List of the K best score dictionaries, highest first
+        """
+        return [entry[2] for entry in sorted(self._heap, key=lambda entry: entry[:2], reverse=True)]
+
+class Leaderboards:
+    """
+    In-memory top-K boards: global, per guild, per playlist and per mode.
+    Boards are loaded from the ScoreStore once and then updated as games end.
+    """
+    def __init__(self, size=10):
+        """
+        :params size: Number of scores kept on each board
+        """
+        self.size = size
+        self.boards = {}
+        self._loading = None
+
+    def keys_for(self, score_data):
+        """
+        Get the boards a score belongs to.
+        :params score_data: Score dictionary
+        :return: List of board keys
+        """
+        keys = [("global", None), ("mode", score_data["mode"]), ("playlist", score_data["playlist"].lower())]
+        if score_data.get("guild_id") is not None:
+            keys.append(("guild", score_data["guild_id"]))
+        return keys
+
+    def add(self, score_data, keys=None):
+        """
+        Add a score to its boards.
+        :params score_data: Score dictionary
+        :params keys: Boards to update, all of the score's boards if not given
+        """
+        for key in keys or self.keys_for(score_data):
+            board = self.boards.get(key)
+            if board is None:
+                board = self.boards[key] = Leaderboard(self.size)
+            board.add(score_data)
+
+    def top(self, kind, value=None):
+        """
+        Read a board.
+        :params kind: Board type (global, guild, playlist or mode)
+        :params value: Guild id, playlist name or mode
+        :return: List of score dictionaries, highest first
+        """
+        if kind == "playlist" and value is not None:
+            value = value.lower()
+        board = self.boards.get((kind, value))
+        return board.top() if board is not None else []
+
+    async def ensure_loaded(self, store):
+        """
+        Load the boards from the store the first time they are needed.
+        :params store: ScoreStore to load from
+        """
+        if self._loading is None:
+            self._loading = asyncio.ensure_future(self._load(store))
+        try:
+            await asyncio.shield(self._loading)
+        except Exception:
+            self._loading = None
+            raise
+
+    async def _load(self, store):
+        for score_data in await store.top_scores(self.size):
+            self.add(score_data, [("global", None)])
+        for score_data in await store.top_scores_per("mode", self.size):
+            self.add(score_data, [("mode", score_data["mode"])])
+        for score_data in await store.top_scores_per("playlist", self.size):
+            self.add(score_data, [("playlist", score_data["playlist"].lower())])
+        for score_data in await store.top_scores_per("guild_id", self.size):
+            if score_data["guild_id"] is not None:
+                self.add(score_data, [("guild", score_data["guild_id"])])
+
+def parse_legacy_line(line):
+    """
+    Parse a line of high_scores.txt (player:score:playlist:mode).
+    Playlist names may contain ':', so the score is the first numeric field and the mode the last one.
+    :params line: Line of the file
+    :return: Score dictionary, or None if the line is not valid
+    """
+    parts = line.strip().split(":")
+    if len(parts) < 4:
+        return None
+    for index in range(1, len(parts) - 2):
+        if parts[index].isdigit():
+            return {
+                "player": ":".join(parts[:index]),
+                "score": int(parts[index]),
+                "playlist": ":".join(parts[index + 1:-1]),
+                "mode": parts[-1]
+            }
+    return None
@@ -0,0 +1,255 @@
+import asyncio
+import time
+import spotify
+
+class Snapshot:
+    """
+    A slowly changing dataset kept in memory.
+    Reads never wait once it has been loaded: a stale snapshot is returned as is
+    and revalidated in the background (stale-while-revalidate).
+    """
+    def __init__(self, name, load, refresh_interval=3600, retry_delay=60):
+        """
+        :params name: Name of the dataset, used in logs
+        :params load: Coroutine function taking a token and returning the dataset
+        :params refresh_interval: Seconds after which the snapshot is refreshed
+        :params retry_delay: Seconds to wait before retrying a failed refresh
+        """
+        self.name = name
+        self.load = load
+        self.refresh_interval = refresh_interval
+        self.retry_delay = retry_delay
+        self.value = None
+        self.loaded_at = None
+        self.refreshes = 0
+        self.failures = 0
+        self._retry_at = 0
+        self._refreshing = None
+
+    @property
+    def loaded(self):
+        return self.loaded_at is not None
+
+    def is_stale(self):
+        """
+        :return: True if the snapshot is missing or older than the refresh interval
+        """
+        return not self.loaded or time.monotonic() - self.loaded_at >= self.refresh_interval
+
+    async def get(self, token):
+        """
+        Get the dataset. Only the very first load waits for Spotify.
+        :params token: Spotify API token
+        :return: Dataset
+        """
+        if not self.loaded:
+            return await self.refresh(token)
+        if self.is_stale() and time.monotonic() >= self._retry_at:
+            self.refresh_in_background(token)
+        return self.value
+
+    async def refresh(self, token):
+        """
+        Reload the dataset. Callers arriving while a reload is running wait for it.
+        :params token: Spotify API token
+        :return: Dataset
+        """
+        if self._refreshing is None:
+            self._refreshing = asyncio.ensure_future(self._reload(token))
+        await asyncio.shield(self._refreshing)
+        return self.value
+
+    def refresh_in_background(self, token):
+        """
+        Start a reload without waiting for it.
+        :params token: Spotify API token
+        """
+        if self._refreshing is None:
+            asyncio.ensure_future(self.refresh_quietly(token))
+
+    async def refresh_quietly(self, token):
+        """
+        Reload the dataset and log errors instead of raising them. The old dataset is kept on errors.
+        :params token: Spotify API token
+        """
+        try:
+            await self.refresh(token)
+        except Exception as e:
+            print(f"Error refreshing {self.name} snapshot: {e}")
+
+    async def _reload(self, token):
+        try:
+            self.value = await self.load(token)
+            self.loaded_at = time.monotonic()
+            self.refreshes += 1
+        except Exception:
+            self.failures += 1
+            self._retry_at = time.monotonic() + self.retry_delay
+            raise
+        finally:
+            self._refreshing = None
+
+class BrowseData:
+    """
+    Snapshots of Spotify's browse data: categories (with a name to id index), genres,
+    featured playlists and new releases per country (already split by album type).
+    Everything is loaded at startup and refreshed in the background, so the
+    commands that list them never wait on Spotify.
+    """
+    def __init__(self, refresh_interval=3600):
+        """
+        :params refresh_interval: Seconds between refreshes of every snapshot
+        """
+        self.refresh_interval = refresh_interval
+        self.categories = Snapshot("categories", self._load_categories, refresh_interval)
+        self.genres = Snapshot("genres", self._load_genres, refresh_interval)
+        self.featured_playlists = Snapshot("featured playlists", self._load_featured_playlists, refresh_interval)
+        self.new_releases = {}
+        self._background_task = None
+
+    def configure(self, refresh_interval=None):
+        """
+        Change the refresh interval of every snapshot.
+        :params refresh_interval: Seconds between refreshes
+        """
+        if refresh_interval is not None:
+            self.refresh_interval = refresh_interval
+            for snapshot in self.snapshots():
+                snapshot.refresh_interval = refresh_interval
+
+    def snapshots(self):
+        """
+        :return: List of every snapshot, including the new releases of each country seen so far
+        """
+        return [self.categories, self.genres, self.featured_playlists] + list(self.new_releases.values())
+
+    def start(self, token, countries=("",)):
+        """
+        Load every snapshot and keep refreshing them in the background. Safe to call more than once.
+        :params token: Spotify API token
+        :params countries: Country codes whose new releases are loaded at startup ("" for Spotify's default)
+        """
+        if self._background_task is None or self._background_task.done():
+            for country in countries:
+                self._new_releases_snapshot(country)
+            self._background_task = asyncio.create_task(self._keep_fresh(token))
+
+    async def _keep_fresh(self, token):
+        while True:
+            await asyncio.gather(*(snapshot.refresh_quietly(token) for snapshot in self.snapshots()))
+            await asyncio.sleep(self.refresh_interval)
+
+    async def get_categories(self, token):
+        """
+        :params token: Spotify API token
+        :return: Dictionary with the list of categories (items) and a lowercase name to id index (by_name)
+        """
+        return await self.categories.get(token)
+
+    async def get_category_id(self, token, name):
+        """
+        Find a category by name.
+        :params token: Spotify API token
+        :params name: Category name, in any case
+        :return: Category ID, or None if there is no category with that name
+        """
+        categories = await self.get_categories(token)
+        return categories["by_name"].get(name.lower())
+
+    async def get_genres(self, token):
+        """
+        :params token: Spotify API token
+        :return: List of genre seeds
+        """
+        return await self.genres.get(token)
+
+    async def get_featured_playlists(self, token):
+        """
+        :params token: Spotify API token
+        :return: List of featured playlists
+        """
+        return await self.featured_playlists.get(token)
+
+    async def get_new_releases(self, token, country=""):
+        """
+        Get the new releases of a country. A country is loaded the first time it is asked
+        for and only kept if Spotify accepts it.
+        :params token: Spotify API token
+        :params country: Country code ("" for Spotify's default)
+        :return: Dictionary of album type (album, single, compilation) to list of releases
+        """
+        snapshot = self._new_releases_snapshot(country)
+        try:
+            return await snapshot.get(token)
+        except Exception:
+            if not snapshot.loaded and self.new_releases.get(country) is snapshot:
+                del self.new_releases[country]
+            raise
+
+    def _new_releases_snapshot(self, country):
+        snapshot = self.new_releases.get(country)
+        if snapshot is None:
+            async def load(token):
+                return await self._load_new_releases(token, country)
+            snapshot = self.new_releases[country] = Snapshot(f"new releases {country or 'default'}", load, self.refresh_interval)
+        return snapshot
+
+    def stats(self):
+        """
+        Get the state of every snapshot.
+        :return: Dictionary of snapshot name to age in seconds (None if not loaded), refreshes and failures
+        """
+        now = time.monotonic()
+        return {
+            snapshot.name: {
+                "age": now - snapshot.loaded_at if snapshot.loaded else None,
+                "refreshes": snapshot.refreshes,
+                "failures": snapshot.failures
+            }
+            for snapshot in self.snapshots()
+        }
+
+    async def _read_all(self, token, url, list_key, params=None, max_items=None):
+        items = []
+        page_params = dict(params or {})
+        page_params["limit"] = 50
+        while True:
+            page_params["offset"] = len(items)
+            api_response = await spotify.client.get(url, token, params=dict(page_params), priority=spotify.BULK)
+            api_response.raise_for_status()
+            page = api_response.json()[list_key]
+            items.extend(page["items"])
+            if page.get("next") is None or not page["items"] or (max_items is not None and len(items) >= max_items):
+                return items[:max_items]
+
+    async def _load_categories(self, token):
+        items = await self._read_all(token, f"{spotify.API_URL}/browse/categories", "categories")
+        categories = [{"id": category["id"], "name": category["name"]} for category in items]
+        return {
+            "items": categories,
+            "by_name": {category["name"].lower(): category["id"] for category in categories}
+        }
+
+    async def _load_genres(self, token):
+        api_response = await spotify.client.get(f"{spotify.API_URL}/recommendations/available-genre-seeds", token, priority=spotify.BULK)
+        api_response.raise_for_status()
+        return api_response.json()["genres"]
+
+    async def _load_featured_playlists(self, token):
+        items = await self._read_all(token, f"{spotify.API_URL}/browse/featured-playlists", "playlists", max_items=100)
+        return [
+            {"id": playlist["id"], "name": playlist["name"], "owner": playlist["owner"]["display_name"]}
+            for playlist in items if playlist is not None
+        ]
+
+    async def _load_new_releases(self, token, country):
+        params = {"country": country} if country != "" else None
+        items = await self._read_all(token, f"{spotify.API_URL}/browse/new-releases", "albums", params=params, max_items=100)
+        releases = {}
+        for album in items:
+            releases.setdefault(album["album_type"], []).append({
+                "name": album["name"],
+                "artist": album["artists"][0]["name"] if album["artists"] else "",
+                "release_date": album["release_date"]
+            })
+        return releases
@@ -0,0 +1,414 @@
+import asyncio
+import heapq
+import itertools
+import json
+import random
+import time
+import urllib.parse
+from collections import Counter
+import aiohttp
+import tracing
+
+API_URL = "https://api.spotify.com/v1"
+ACCOUNTS_URL = "https://accounts.spotify.com"
+
+# Priority lanes of the rate limiter, lower runs first
+INTERACTIVE = 0
+BULK = 1
+
+# Path segments kept in endpoint names, any other segment is an ID
+ENDPOINT_SEGMENTS = {
+    "v1", "api", "token", "search", "artists", "albums", "tracks", "playlists", "audio-features",
+    "top-tracks", "related-artists", "browse", "new-releases", "categories", "featured-playlists",
+    "recommendations", "available-genre-seeds"
+}
+
+def endpoint_name(url):
+    """
+    Get the endpoint of a url without its IDs, e.g. /v1/artists/{id}/albums.
+    :params url: Full URL of a request
+    :return: Endpoint name
+    """
+    segments = urllib.parse.urlsplit(url).path.split("/")
+    return "/" + "/".join(segment if segment in ENDPOINT_SEGMENTS else "{id}" for segment in segments if segment)
+
+class SpotifyError(Exception):
+    """
+    Raised when the Spotify API answers with an error status.
+    """
+    def __init__(self, status_code, url):
+        super().__init__(f"Spotify API returned {status_code} for {url}")
+        self.status_code = status_code
+        self.url = url
+
+REQUEST_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, SpotifyError)
+
+class SpotifyResponse:
+    """
+    Response returned by the Spotify client. Mirrors the small part of the
+    requests API the handlers use (status_code, headers, content, json(), raise_for_status()).
+    """
+    def __init__(self, url, status_code, headers, content):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content) if self.content else None
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise SpotifyError(self.status_code, self.url)
+
+class RateLimiter:
+    """
+    Token bucket shared by every outbound Spotify call.
+    Waiting calls are served by priority lane (INTERACTIVE before BULK), and a
+    429 Retry-After pauses all lanes until Spotify accepts requests again.
+    """
+    def __init__(self, rate=10, burst=20):
+        """
+        :params rate: Requests allowed per second
+        :params burst: Maximum number of requests that can be sent at once
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.paused_until = 0
+        self._updated = time.monotonic()
+        self._waiters = []
+        self._counter = itertools.count()
+        self._dispatcher = None
+
+    def configure(self, rate=None, burst=None):
+        """
+        Change the limiter settings.
+        :params rate: Requests allowed per second
+        :params burst: Maximum number of requests that can be sent at once
+        """
+        if rate is not None:
+            self.rate = rate
+        if burst is not None:
+            self.burst = burst
+            self.tokens = min(self.tokens, burst)
+
+    def queued(self):
+        """
+        :return: Number of calls waiting for their turn
+        """
+        return len(self._waiters)
+
+    def pause(self, seconds):
+        """
+        Stop sending requests for a while (e.g. after a 429 with Retry-After).
+        :params seconds: Seconds to pause
+        """
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self, priority=INTERACTIVE):
+        """
+        Wait until a request may be sent.
+        :params priority: Priority lane of the request (INTERACTIVE or BULK)
+        """
+        now = time.monotonic()
+        self._refill(now)
+        if not self._waiters and now >= self.paused_until and self.tokens >= 1:
+            self.tokens -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+        await future
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def _dispatch(self):
+        while self._waiters:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self._refill(now)
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.tokens -= 1
+                future.set_result(None)
+
+class SpotifyClient:
+    """
+    Shared async HTTP client for the Spotify API.
+    Keeps one pooled keep-alive session so handlers never block the event loop.
+    """
+    def __init__(self, timeout=10, max_connections=100, keepalive_timeout=60, max_retries=3, backoff=0.5):
+        """
+        :params timeout: Total timeout of each request, in seconds
+        :params max_connections: Maximum number of pooled connections
+        :params keepalive_timeout: Seconds an idle connection is kept open
+        :params max_retries: Retries of a GET after a 429, 5xx or connection error
+        :params backoff: Base delay, in seconds, of the jittered exponential backoff
+        """
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.max_connections = max_connections
+        self.keepalive_timeout = keepalive_timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.limiter = RateLimiter()
+        self.retries = 0
+        self.throttled = 0
+        self.coalesced = 0
+        self.calls = Counter()
+        self._in_flight = {}
+        self._session = None
+
+    @property
+    def session(self):
+        """
+        Session is created lazily because it must be bound to the running loop.
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=300
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+
+    async def request(self, method, url, headers=None, params=None, data=None):
+        """
+        Send a request and read the whole body.
+        :params method: HTTP method
+        :params url: Full URL of the request
+        :params headers: Request headers
+        :params params: Query parameters
+        :params data: Form data for POST requests
+        :return: SpotifyResponse
+        """
+        endpoint = endpoint_name(url)
+        with tracing.span("spotify.http", method=method, endpoint=endpoint) as span:
+            try:
+                async with self.session.request(method, url, headers=headers, params=params, data=data) as response:
+                    content = await response.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                self.calls[(endpoint, "error")] += 1
+                raise
+            self.calls[(endpoint, str(response.status))] += 1
+            span.set(status=response.status)
+        return SpotifyResponse(str(response.url), response.status, response.headers, content)
+
+    async def get(self, url, token=None, headers=None, params=None, priority=INTERACTIVE):
+        """
+        GET a Spotify API url. Identical GETs made while one is already in flight
+        share its HTTP call and response; the saved calls are counted in coalesced.
+        :params url: Full URL of the request
+        :params token: Token manager that provides the authorization header
+        :params headers: Extra request headers
+        :params params: Query parameters
+        :params priority: Priority lane (INTERACTIVE for user lookups, BULK for background work)
+        :return: SpotifyResponse
+        """
+        key = (
+            url,
+            id(token),
+            tuple(sorted((params or {}).items())),
+            tuple(sorted((headers or {}).items()))
+        )
+        with tracing.span("spotify.get", endpoint=endpoint_name(url)) as span:
+            task = self._in_flight.get(key)
+            if task is None:
+                task = asyncio.ensure_future(self._get(url, token, headers, params, priority))
+                self._in_flight[key] = task
+                task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+            else:
+                self.coalesced += 1
+                span.set(coalesced=True)
+            return await asyncio.shield(task)
+
+    async def _get(self, url, token=None, headers=None, params=None, priority=INTERACTIVE):
+        """
+        GET a Spotify API url through the rate limiter.
+        If a token manager is given its bearer header is added, and a 401 answer
+        triggers one shared token refresh followed by a single retry.
+        429 answers pause every request for Retry-After seconds; 429, 5xx and
+        connection errors are retried with jittered exponential backoff.
+        :params url: Full URL of the request
+        :params token: Token manager that provides the authorization header
+        :params headers: Extra request headers
+        :params params: Query parameters
+        :params priority: Priority lane (INTERACTIVE for user lookups, BULK for background work)
+        :return: SpotifyResponse
+        """
+        headers = dict(headers or {})
+        auth_header = {}
+        refreshed = False
+        attempt = 0
+        while True:
+            if token is not None:
+                auth_header = await token.get_auth_header()
+            with tracing.span("spotify.rate_limiter", priority=priority):
+                await self.limiter.acquire(priority)
+            try:
+                response = await self.request("GET", url, headers={**headers, **auth_header}, params=params)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self.retries += 1
+                await asyncio.sleep(self._backoff_delay(attempt))
+                continue
+
+            if response.status_code == 401 and token is not None and not refreshed:
+                refreshed = True
+                await token.refresh(auth_header)
+                continue
+
+            if response.status_code == 429 or response.status_code >= 500:
+                if response.status_code == 429:
+                    self.throttled += 1
+                    self.limiter.pause(self._retry_after(response))
+                if attempt >= self.max_retries:
+                    return response
+                attempt += 1
+                self.retries += 1
+                await asyncio.sleep(self._backoff_delay(attempt))
+                continue
+
+            return response
+
+    def _backoff_delay(self, attempt):
+        return random.uniform(0, self.backoff * 2 ** attempt)
+
+    def _retry_after(self, response):
+        try:
+            return float(response.headers.get("Retry-After", 1))
+        except ValueError:
+            return 1
+
+    async def post(self, url, headers=None, data=None):
+        """
+        POST to a Spotify url.
+        :params url: Full URL of the request
+        :params headers: Request headers
+        :params data: Form data
+        :return: SpotifyResponse
+        """
+        return await self.request("POST", url, headers=headers, data=data)
+
+    def stats(self):
+        """
+        Get client counters.
+        :return: Dictionary with HTTP calls, retries, 429 answers and coalesced requests
+        """
+        return {
+            "calls": sum(self.calls.values()),
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "coalesced": self.coalesced
+        }
+
+    async def close(self):
+        """
+        Close the pooled session.
+        """
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+client = SpotifyClient()
+
+class BatchLoader:
+    """
+    Merges single-ID lookups that arrive within a short window into one request
+    to a Spotify multi-ID endpoint (e.g. /v1/artists?ids=).
+    """
+    def __init__(self, path, result_key, max_batch=50, window=0.02):
+        """
+        :params path: Endpoint path under the API url (artists, tracks, audio-features)
+        :params result_key: Key of the list in the JSON response
+        :params max_batch: Maximum number of IDs Spotify accepts per request
+        :params window: Seconds to wait for more IDs before sending a batch
+        """
+        self.path = path
+        self.result_key = result_key
+        self.max_batch = max_batch
+        self.window = window
+        self.requests = 0
+        self.loaded = 0
+        self._pending = {}
+        self._token = None
+        self._priority = BULK
+        self._flush_handle = None
+
+    async def load(self, token, item_id, priority=INTERACTIVE):
+        """
+        Load one object.
+        :params token: Spotify API token
+        :params item_id: Spotify ID
+        :params priority: Rate limiter lane, a batch uses the most urgent lane of its callers
+        :return: JSON object, or None if Spotify does not know the ID
+        """
+        return await self._enqueue(token, item_id, priority)
+
+    async def load_many(self, token, item_ids, priority=INTERACTIVE):
+        """
+        Load several objects, in the same order as the IDs.
+        :params token: Spotify API token
+        :params item_ids: List of Spotify IDs
+        :params priority: Rate limiter lane, a batch uses the most urgent lane of its callers
+        :return: List of JSON objects (None for unknown IDs)
+        """
+        return await asyncio.gather(*[self._enqueue(token, item_id, priority) for item_id in item_ids])
+
+    def _enqueue(self, token, item_id, priority):
+        # Callers waiting on the same ID share one future; each gets it through
+        # a shield, so a cancelled caller does not cancel it for the others.
+        self._priority = min(self._priority, priority)
+        future = self._pending.get(item_id)
+        if future is not None:
+            return asyncio.shield(future)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending[item_id] = future
+        self._token = token
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+        return asyncio.shield(future)
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, {}
+        priority, self._priority = self._priority, BULK
+        item_ids = list(pending)
+        for start in range(0, len(item_ids), self.max_batch):
+            batch = {item_id: pending[item_id] for item_id in item_ids[start:start + self.max_batch]}
+            asyncio.ensure_future(self._fetch(self._token, batch, priority))
+
+    async def _fetch(self, token, batch, priority):
+        self.requests += 1
+        try:
+            response = await client.get(f"{API_URL}/{self.path}", token, params={"ids": ",".join(batch)}, priority=priority)
+            response.raise_for_status()
+            items = response.json()[self.result_key]
+            for future, item in zip(batch.values(), items):
+                if not future.done():
+                    future.set_result(item)
+            for future in batch.values():
+                if not future.done():
+                    future.set_result(None)
+            self.loaded += len(batch)
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
@@ -0,0 +1,21 @@
+import asyncio
+import json
+import spotify
+
+def test_batch_loader_cancelled_caller_does_not_cancel_others(monkeypatch):
+    async def fake_get(url, token=None, headers=None, params=None, priority=spotify.INTERACTIVE):
+        await asyncio.sleep(0.01)
+        items = [{"id": item_id} for item_id in params["ids"].split(",")]
+        return spotify.SpotifyResponse(url, 200, {}, json.dumps({"artists": items}).encode())
+
+    monkeypatch.setattr(spotify.client, "get", fake_get)
+
+    async def run():
+        loader = spotify.BatchLoader("artists", "artists", window=0.01)
+        first = asyncio.ensure_future(loader.load(None, "abc"))
+        second = asyncio.ensure_future(loader.load(None, "abc"))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()) == {"id": "abc"}
@@ -0,0 +1,198 @@
+import concurrent.futures
+import contextvars
+import json
+import time
+
+_current = contextvars.ContextVar("tracing_span", default=None)
+
+class Span:
+    """
+    Timed step of a trace. Used as a context manager; spans opened inside it,
+    including in tasks started inside it, become its children.
+    """
+    def __init__(self, trace, name, parent, attributes):
+        """
+        :params trace: Trace the span belongs to
+        :params name: Name of the step (e.g. spotify.http)
+        :params parent: Parent span, None for the root span
+        :params attributes: Dictionary of extra information
+        """
+        self.trace = trace
+        self.name = name
+        self.parent = parent
+        self.attributes = attributes
+        self.start = None
+        self.end = None
+        self._token = None
+        trace.spans.append(self)
+
+    def set(self, **attributes):
+        """
+        Add attributes to the span.
+        """
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.end = time.perf_counter()
+        _current.reset(self._token)
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        if self.parent is None:
+            self.trace.finish()
+        return False
+
+class NoopSpan:
+    """
+    Span used when no trace is active. Does nothing.
+    """
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+NOOP = NoopSpan()
+
+class Trace:
+    """
+    Spans of one command, identified by the ID of the Discord message that started it.
+    """
+    def __init__(self, tracer, trace_id, max_spans):
+        """
+        :params tracer: Tracer that receives the trace when it finishes
+        :params trace_id: ID of the trace (the Discord message ID)
+        :params max_spans: Maximum number of spans kept, later spans are dropped
+        """
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.max_spans = max_spans
+        self.started_at = time.time()
+        self.spans = []
+        self.dropped = 0
+        self.finished = False
+
+    @property
+    def root(self):
+        return self.spans[0]
+
+    @property
+    def duration(self):
+        return self.root.end - self.root.start
+
+    def finish(self):
+        self.finished = True
+        self.tracer.finish(self)
+
+    def to_dict(self):
+        """
+        :return: Dictionary with the trace and its span breakdown, times in milliseconds from the start
+        """
+        origin = self.root.start
+        index = {id(span): number for number, span in enumerate(self.spans)}
+        return {
+            "trace_id": str(self.trace_id),
+            "name": self.root.name,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": self.root.attributes,
+            "dropped_spans": self.dropped,
+            "spans": [
+                {
+                    "id": number,
+                    "parent": index.get(id(span.parent)) if span.parent is not None else None,
+                    "name": span.name,
+                    "start_ms": round((span.start - origin) * 1000, 3) if span.start is not None else None,
+                    "duration_ms": round((span.end - span.start) * 1000, 3) if span.end is not None else None,
+                    "attributes": span.attributes
+                }
+                for number, span in enumerate(self.spans)
+            ]
+        }
+
+class Tracer:
+    """
+    Starts traces and writes the slow ones, with their span breakdown, to a
+    JSON lines log. The log is written by a writer thread, so a slow command
+    never waits on the disk. Spans cost almost nothing when no trace is active.
+    """
+    def __init__(self, slow_threshold=2.0, slow_log_path="slow_commands.log", max_spans=500):
+        """
+        :params slow_threshold: Seconds after which a trace is written to the slow log
+        :params slow_log_path: Path of the slow log, empty to disable it
+        :params max_spans: Maximum number of spans kept per trace
+        """
+        self.slow_threshold = slow_threshold
+        self.slow_log_path = slow_log_path
+        self.max_spans = max_spans
+        self.traces = 0
+        self.slow = 0
+        self._writer = None
+
+    def configure(self, slow_threshold=None, slow_log_path=None):
+        """
+        Change the tracer settings.
+        :params slow_threshold: Seconds after which a trace is written to the slow log
+        :params slow_log_path: Path of the slow log, empty to disable it
+        """
+        if slow_threshold is not None:
+            self.slow_threshold = slow_threshold
+        if slow_log_path is not None:
+            self.slow_log_path = slow_log_path
+
+    def trace(self, trace_id, name, **attributes):
+        """
+        Start a trace. Use the result as a context manager.
+        :params trace_id: ID of the trace (the Discord message ID)
+        :params name: Name of the root span
+        :return: Root span of the trace
+        """
+        return Span(Trace(self, trace_id, self.max_spans), name, None, attributes)
+
+    def finish(self, trace):
+        """
+        Handle a finished trace: write it to the slow log if it took too long.
+        :params trace: Finished trace
+        """
+        self.traces += 1
+        if trace.duration < self.slow_threshold or not self.slow_log_path:
+            return
+        self.slow += 1
+        if self._writer is None:
+            self._writer = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="slow-log")
+        self._writer.submit(write_line, self.slow_log_path, json.dumps(trace.to_dict(), default=str))
+
+def write_line(path, line):
+    """
+    Append a line to a log file. Runs on the writer thread.
+    :params path: Path of the log
+    :params line: Line to append, without the newline
+    """
+    try:
+        with open(path, "a") as file:
+            file.write(line + "\n")
+    except OSError as e:
+        print(f"Error writing slow log: {e}")
+
+def span(name, **attributes):
+    """
+    Open a span in the current trace. Use the result as a context manager.
+    :params name: Name of the step
+    :return: Span, or a no-op span if there is no active trace
+    """
+    parent = _current.get()
+    if parent is None or parent.trace.finished:
+        return NOOP
+    if len(parent.trace.spans) >= parent.trace.max_spans:
+        parent.trace.dropped += 1
+        return NOOP
+    return Span(parent.trace, name, parent, attributes)
+
+tracer = Tracer()
@@ -0,0 +1,126 @@
+import asyncio
+import discord
+
+class PaginatedView(discord.ui.View):
+    """
+    Previous/next buttons for long listings.
+    A page is fetched and rendered only when a user asks for it, and the view
+    drops its pages and buttons once it has been idle for the timeout.
+    """
+    def __init__(self, title, load_page, first_page, has_next, timeout=180):
+        """
+        :params title: Title of the embed
+        :params load_page: Coroutine function taking a page number and returning (text, has_next)
+        :params first_page: Text of page 0, already loaded
+        :params has_next: Boolean to check if there is a page after page 0
+        :params timeout: Seconds without interaction before the view is evicted
+        """
+        super().__init__(timeout=timeout)
+        self.title = title
+        self.load_page = load_page
+        self.page = 0
+        self.pages = {0: (first_page, has_next)}
+        self.message = None
+        self._lock = asyncio.Lock()
+        self._update_buttons()
+
+    def make_embed(self):
+        """
+        Create the embed of the current page.
+        :return: Discord embed
+        """
+        text, _ = self.pages[self.page]
+        return discord.Embed(title=self.title, description=text, color=discord.Color.green())
+
+    def _update_buttons(self):
+        _, has_next = self.pages[self.page]
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = not has_next
+
+    async def _show(self, interaction, page):
+        async with self._lock:
+            if page not in self.pages:
+                await interaction.response.defer()
+                try:
+                    self.pages[page] = await self.load_page(page)
+                except Exception as e:
+                    print(f"Error in PaginatedView: {e}")
+                    return
+                self.page = page
+                self._update_buttons()
+                await interaction.edit_original_response(embed=self.make_embed(), view=self)
+                return
+            self.page = page
+            self._update_buttons()
+            await interaction.response.edit_message(embed=self.make_embed(), view=self)
+
+    @discord.ui.button(label="◀ Prev", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction, button):
+        await self._show(interaction, max(self.page - 1, 0))
+
+    @discord.ui.button(label="Next ▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction, button):
+        await self._show(interaction, self.page + 1)
+
+    async def on_timeout(self):
+        self.pages = {self.page: self.pages[self.page]}
+        self.load_page = None
+        if self.message is not None:
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass
+
+class GameVoteView(discord.ui.View):
+    """
+    Persistent higher/lower buttons for game rounds.
+    One instance is registered with the bot and serves every game: votes are
+    routed by message ID, so the buttons keep working after a restart and the
+    round message never needs reactions.
+    """
+    def __init__(self, on_vote, higher, lower):
+        """
+        :params on_vote: Function taking (message_id, user_name, answer) and returning True if the vote was counted
+        :params higher: Answer sent by the higher button
+        :params lower: Answer sent by the lower button
+        """
+        super().__init__(timeout=None)
+        self.on_vote = on_vote
+        self.higher = higher
+        self.lower = lower
+
+    async def _vote(self, interaction, answer):
+        if self.on_vote(interaction.message.id, interaction.user.name, answer):
+            await interaction.response.send_message(f"You answered {answer}", ephemeral=True)
+        else:
+            await interaction.response.send_message("Your answer for this round is already in, or the round is closed.", ephemeral=True)
+
+    @discord.ui.button(label="Higher", emoji="⬆️", style=discord.ButtonStyle.success, custom_id="game:higher")
+    async def higher_button(self, interaction, button):
+        await self._vote(interaction, self.higher)
+
+    @discord.ui.button(label="Lower", emoji="⬇️", style=discord.ButtonStyle.danger, custom_id="game:lower")
+    async def lower_button(self, interaction, button):
+        await self._vote(interaction, self.lower)
+
+def list_pages(header, lines, page_size=20):
+    """
+    Build a page loader over a list that is already in memory.
+    :params header: First line of every page
+    :params lines: Lines of the listing
+    :params page_size: Number of lines per page
+    :return: Coroutine function taking a page number and returning (text, has_next)
+    """
+    async def load_page(page):
+        start = page * page_size
+        return format_page(header, lines[start:start + page_size]), start + page_size < len(lines)
+    return load_page
+
+def format_page(header, lines):
+    """
+    Format a page in the bot's code block style.
+    :params header: First line of the page
+    :params lines: Lines of the page
+    :return: Text of the page
+    """
+    return "`" + header + "\n" + "\n".join("\t" + line for line in lines) + "`"